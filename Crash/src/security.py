@@ -2,29 +2,30 @@ import hashlib
 import os
 import platform
 import subprocess
+from functools import lru_cache
 
 
+@lru_cache(maxsize=1)
 def get_hwid():
     """
     Gera uma assinatura única (Fingerprint) do computador.
     Combina Processador + Placa Mãe + Disco para criar um hash único.
+
+    Memoizado: o hardware não muda com o processo rodando, e cada chamada
+    dispararia de novo os subprocessos do WMIC (a telemetria chama a cada evento).
     """
     try:
         system_info = platform.system()
 
         if system_info == "Windows":
-            # Comando para pegar UUID da Placa Mãe
-            cmd = "wmic csproduct get uuid"
-            uuid = subprocess.check_output(cmd).decode().split("\n")[1].strip()
-
-            # Comando para pegar Serial do Disco C:
-            cmd_disk = "vol c:"
-            disk = (
-                subprocess.check_output(cmd_disk, shell=True)
-                .decode()
-                .split()[-1]
-                .strip()
-            )
+            # UUID da Placa Mãe + Serial do Disco C: num único processo (cmd.exe).
+            # "&&" mantém o comportamento antigo: se qualquer um falhar, a
+            # exceção cai no fallback abaixo. A saída do wmic vem primeiro
+            # (UUID na 2ª linha) e a do vol por último (serial no último token)
+            cmd = 'cmd /c "wmic csproduct get uuid && vol c:"'
+            saida = subprocess.check_output(cmd).decode()
+            uuid = saida.split("\n")[1].strip()
+            disk = saida.split()[-1].strip()
 
             # Combina os dois
             raw_id = f"{uuid}-{disk}"
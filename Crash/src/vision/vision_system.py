@@ -12,10 +12,11 @@ import contextlib
 import json
 import logging
 import os
+import re
 import sys
-from collections import deque
+import threading
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import cv2
 import mss
@@ -32,6 +33,25 @@ except ImportError:
     EASYOCR_AVAILABLE = False
     print("EasyOCR não instalado. Usando apenas pytesseract.")
 
+# OpenCL (iGPU/dGPU) para o pré-processamento via cv2.UMat, quando existir
+OPENCL_AVAILABLE = cv2.ocl.haveOpenCL()
+cv2.ocl.setUseOpenCL(OPENCL_AVAILABLE)
+
+# Capacidade do histórico de multiplicadores (buffer circular em NumPy)
+VALUE_HISTORY_CAPACITY = 4096
+# Quantos valores recentes definem a faixa esperada do próximo multiplicador
+EXPECTED_RANGE_WINDOW = 5
+
+# Correções de leitura do OCR no multiplicador (X some, letras viram dígitos)
+_MULTIPLIER_OCR_FIXES = str.maketrans(
+    {"X": None, "O": "0", "I": "1", "L": "1", "S": "5", "B": "8", "G": "6"}
+)
+# Tudo que não é dígito ou ponto decimal
+_NON_NUMERIC_RE = re.compile(r"[^0-9.]")
+
+# Variações de APOSTA (APOSTA, APOSTAR, APOSTE, APOST, POSTA, BET) num só padrão
+_APOSTA_RE = re.compile(r"APOST(?:A|AR|E)?|POSTA|BET")
+
 
 class VisionSystem:
     """Sistema de visão otimizado para PyInstaller (--onefile)."""
@@ -85,7 +105,18 @@ class VisionSystem:
             except Exception as e:
                 self.logger.error(f"Erro EasyOCR: {e}")
 
-        self.value_history = deque(maxlen=5)
+        # Captura: um mss + buffers por thread (saldo, multiplicador e detecção
+        # chamam capture_region de threads diferentes)
+        self._capture_local = threading.local()
+
+        # Saldo, multiplicador e detecção rodam em threads diferentes: o mesmo
+        # Reader do EasyOCR nunca executa dois readtext ao mesmo tempo
+        self._easyocr_lock = threading.Lock()
+
+        # Histórico de multiplicadores: array contíguo + índice de escrita
+        self._vh = np.empty(VALUE_HISTORY_CAPACITY, dtype=np.float32)
+        self._vh_i = 0
+        self._vh_n = 0
         self.balance_corrections = self.load_balance_corrections()
         print("✅ VisionSystem inicializado (Modo OneFile)")
 
@@ -204,18 +235,40 @@ class VisionSystem:
         return cache
 
     def capture_region(self, region: Dict) -> Optional[np.ndarray]:
-        """Captura região da tela (função base do código original)"""
+        """
+        Captura região da tela (função base do código original).
+
+        Reaproveita a instância mss e o buffer BGRA da thread atual; o array
+        retornado é sobrescrito na próxima captura do mesmo tamanho.
+        """
         try:
-            with mss.mss() as sct:
-                screenshot = sct.grab(
-                    {
-                        "top": region["y"],
-                        "left": region["x"],
-                        "width": region["width"],
-                        "height": region["height"],
-                    }
-                )
-                return np.array(screenshot)
+            local = self._capture_local
+            if not hasattr(local, "sct"):
+                local.sct = mss.mss()
+                local.buffers = {}
+
+            width, height = region["width"], region["height"]
+            screenshot = local.sct.grab(
+                {
+                    "top": region["y"],
+                    "left": region["x"],
+                    "width": width,
+                    "height": height,
+                }
+            )
+
+            buf = local.buffers.get((width, height))
+            if buf is None:
+                buf = np.empty((height, width, 4), dtype=np.uint8)
+                local.buffers[(width, height)] = buf
+
+            np.copyto(
+                buf,
+                np.frombuffer(screenshot.bgra, dtype=np.uint8).reshape(
+                    height, width, 4
+                ),
+            )
+            return buf
         except Exception as e:
             self.logger.error(f"Erro na captura: {e}")
             return None
@@ -223,33 +276,40 @@ class VisionSystem:
     def preprocess_for_ocr(
         self, img: np.ndarray, target_type: str = "general"
     ) -> np.ndarray:
-        """✅ CORRIGIDO: Pré-processamento otimizado para texto claro em fundo escuro."""
+        """
+        ✅ CORRIGIDO: Pré-processamento otimizado para texto claro em fundo escuro.
+
+        Com OpenCL disponível, a cadeia de filtros roda na GPU (cv2.UMat) e só o
+        resultado final volta para a memória do host.
+        """
+        height, width = img.shape[:2]
+        src = cv2.UMat(img) if OPENCL_AVAILABLE else img
 
         # Garante que a imagem está em escala de cinza (8-bit)
         if len(img.shape) >= 3:
             if img.shape[2] == 4:  # Se for BGRA
-                gray = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
+                gray = cv2.cvtColor(src, cv2.COLOR_BGRA2GRAY)
             else:  # Se for BGR
-                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                gray = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)
         else:
-            gray = img
+            gray = src
 
         # --- LÓGICA ESPECÍFICA PARA O MULTIPLICADOR ---
         if target_type == "balance":
             scale_factor = 3
             gray = cv2.resize(
                 gray,
-                (gray.shape[1] * scale_factor, gray.shape[0] * scale_factor),
+                (width * scale_factor, height * scale_factor),
                 interpolation=cv2.INTER_CUBIC,
             )
             gray = cv2.medianBlur(gray, 3)
             _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            return binary
+            return self._to_host(binary)
 
         elif target_type == "bet_detection":
             gray = cv2.convertScaleAbs(gray, alpha=1.5, beta=0)
             _, binary = cv2.threshold(gray, 100, 255, cv2.THRESH_BINARY)
-            return binary
+            return self._to_host(binary)
 
         elif target_type == "multiplier":
             # Aumenta o tamanho para melhorar a precisão do OCR
@@ -268,9 +328,14 @@ class VisionSystem:
                 maxval=255,
                 type=cv2.THRESH_BINARY_INV,
             )
-            return binary
+            return self._to_host(binary)
+
+        return self._to_host(gray)
 
-        return gray
+    @staticmethod
+    def _to_host(img) -> np.ndarray:
+        """Traz um cv2.UMat de volta para np.ndarray (OCR e templates usam host)."""
+        return img.get() if isinstance(img, cv2.UMat) else img
 
     def pytesseract_extract(
         self, img: np.ndarray, target_type: str = "general"
@@ -343,7 +408,8 @@ class VisionSystem:
             return []
 
         try:
-            results = self.easyocr_reader.readtext(img)
+            with self._easyocr_lock:
+                results = self.easyocr_reader.readtext(img)
             texts = []
             texts.extend(
                 text for bbox, text, confidence in results if float(confidence) > 0.5
@@ -353,6 +419,31 @@ class VisionSystem:
             self.logger.error(f"Erro EasyOCR: {e}")
             return []
 
+    def _first_ocr_match(
+        self, img: np.ndarray, target_type: str, parse: Callable[[str], Any]
+    ) -> Tuple[Any, Optional[str], List[str]]:
+        """
+        Pytesseract primeiro; EasyOCR só se o Tesseract não achou nada aceito.
+
+        Returns:
+            (resultado de `parse`, nome do motor, todos os textos lidos)
+        """
+        textos_lidos: List[str] = []
+
+        for text in self.pytesseract_extract(img, target_type):
+            textos_lidos.append(text)
+            if result := parse(text):
+                return result, "Tesseract", textos_lidos
+
+        # Fallback para EasyOCR se disponível
+        if self.easyocr_reader:
+            for text in self.easyocr_extract(img):
+                textos_lidos.append(text)
+                if result := parse(text):
+                    return result, "EasyOCR", textos_lidos
+
+        return None, None, textos_lidos
+
     def detect_balance_with_templates(self, gray_img: np.ndarray) -> Optional[float]:
         """
         ✅ TOTALMENTE CORRIGIDO: Detecta saldo usando template matching
@@ -594,12 +685,8 @@ class VisionSystem:
             return None
 
         with contextlib.suppress(Exception):
-            # Limpar texto básico
-            text = text.upper().replace("X", "").strip()
-
-            # ✅ OTIMIZAÇÃO: Remover mais caracteres problemáticos
-            text = text.replace("O", "0").replace("I", "1").replace("L", "1")
-            text = text.replace("S", "5").replace("B", "8").replace("G", "6")
+            # Limpar texto básico + caracteres problemáticos numa única passada
+            text = text.upper().translate(_MULTIPLIER_OCR_FIXES).strip()
 
             # Se tem espaços, pode ser número >100 mal interpretado
             if " " in text:
@@ -609,13 +696,9 @@ class VisionSystem:
                 else:
                     text = text.replace(" ", "")
 
-            if not text or not any(c.isdigit() for c in text):
-                return None
-
-            cleaned = "".join(char for char in text if char.isdigit() or char == ".")
-            text = cleaned
+            text = _NON_NUMERIC_RE.sub("", text)
 
-            if not text:
+            if not text.strip("."):
                 return None
 
             # ❌ REMOVIDO: Correções pré-conversão com 7→1
@@ -646,21 +729,41 @@ class VisionSystem:
 
             # ✅ OTIMIZAÇÃO: Validação final mais rigorosa
             if 1.0 <= value <= 999.99:
-                self.value_history.append(value)
+                self._push_value(value)
                 return round(value, 2)
 
         return None
 
+    def _push_value(self, value: float):
+        """Grava um multiplicador no buffer circular do histórico."""
+        self._vh[self._vh_i] = value
+        self._vh_i = (self._vh_i + 1) % VALUE_HISTORY_CAPACITY
+        self._vh_n = min(self._vh_n + 1, VALUE_HISTORY_CAPACITY)
+
+    def recent_values(self, k: int) -> np.ndarray:
+        """Retorna os últimos `k` multiplicadores em ordem cronológica."""
+        k = min(k, self._vh_n)
+        if k <= self._vh_i:
+            return self._vh[self._vh_i - k : self._vh_i]
+        # Janela dá a volta no fim do buffer
+        return np.concatenate(
+            (
+                self._vh[VALUE_HISTORY_CAPACITY - (k - self._vh_i) :],
+                self._vh[: self._vh_i],
+            )
+        )
+
     def get_expected_range(self) -> Tuple[float, float]:
         """✅ OTIMIZADO: Calcula faixa esperada baseada no histórico"""
-        if not self.value_history:
+        recentes = self.recent_values(EXPECTED_RANGE_WINDOW)
+        if not recentes.size:
             return (1.0, 2.5)
 
-        recent_avg = sum(self.value_history) / len(self.value_history)
+        recent_avg = recentes.mean()
 
         # ✅ OTIMIZAÇÃO: Faixa mais dinâmica baseada na variação recente
-        if len(self.value_history) >= 3:
-            recent_std = np.std(self.value_history)
+        if recentes.size >= 3:
+            recent_std = recentes.std()
             min_expected = max(1.0, recent_avg - recent_std)
             max_expected = recent_avg + recent_std * 1.5
         else:
@@ -822,21 +925,11 @@ class VisionSystem:
             if value := self.match_multiplier_with_templates(binary):
                 return value
 
-            # Tentar pytesseract primeiro
-            texts = self.pytesseract_extract(binary, "multiplier")
-
-            for text in texts:
-                if value := self.parse_value_with_context(text):
-                    return value
-
-            # Fallback para EasyOCR se disponível
-            if self.easyocr_reader:
-                easyocr_texts = self.easyocr_extract(binary)
-                for text in easyocr_texts:
-                    if value := self.parse_value_with_context(text):
-                        return value
-
-            return None
+            # Pytesseract primeiro, EasyOCR como fallback
+            value, _, _ = self._first_ocr_match(
+                binary, "multiplier", self.parse_value_with_context
+            )
+            return value
 
         except Exception as e:
             self.logger.error(f"Erro na detecção de multiplicador: {e}")
@@ -851,39 +944,17 @@ class VisionSystem:
 
             binary = self.preprocess_for_ocr(img, "bet_detection")
 
-            # ✅ AJUSTE: Pytesseract com configs específicos para APOSTA
-            texts = self.pytesseract_extract(binary, "bet_detection")
-            for text in texts:
+            def contem_aposta(text: str) -> Optional[str]:
                 text_clean = text.upper().strip()
-                # ✅ AJUSTE: Mais variações de APOSTA
-                aposta_keywords = [
-                    "APOSTA",
-                    "APOSTAR",
-                    "APOSTE",
-                    "BET",
-                    "APOST",
-                    "POSTA",
-                ]
-                if any(keyword in text_clean for keyword in aposta_keywords):
-                    print(f"✅ APOSTA detectada (Tesseract): '{text_clean}'")
-                    return True
+                return text_clean if _APOSTA_RE.search(text_clean) else None
 
-            # ✅ AJUSTE: EasyOCR fallback com debug
-            if self.easyocr_reader:
-                easyocr_texts = self.easyocr_extract(binary)
-                for text in easyocr_texts:
-                    text_clean = text.upper().strip()
-                    aposta_keywords = [
-                        "APOSTA",
-                        "APOSTAR",
-                        "APOSTE",
-                        "BET",
-                        "APOST",
-                        "POSTA",
-                    ]
-                    if any(keyword in text_clean for keyword in aposta_keywords):
-                        print(f"✅ APOSTA detectada (EasyOCR): '{text_clean}'")
-                        return True
+            # ✅ AJUSTE: Pytesseract com configs para APOSTA, EasyOCR como fallback
+            text_clean, motor, texts = self._first_ocr_match(
+                binary, "bet_detection", contem_aposta
+            )
+            if text_clean:
+                print(f"✅ APOSTA detectada ({motor}): '{text_clean}'")
+                return True
 
             # ✅ AJUSTE: Debug quando não detecta (só a cada 10 tentativas para não spam)
             if not hasattr(self, "_debug_counter"):
@@ -914,6 +985,6 @@ class VisionSystem:
         return {
             "templates_loaded": len(self.template_cache),
             "easyocr_available": EASYOCR_AVAILABLE,
-            "value_history_size": len(self.value_history),
-            "recent_values": list(self.value_history),
+            "value_history_size": self._vh_n,
+            "recent_values": self.recent_values(EXPECTED_RANGE_WINDOW).tolist(),
         }
@@ -12,8 +12,9 @@ Fluxo de Dados:
 import time
 import uuid
 from datetime import datetime, timedelta
-from typing import Tuple
+from typing import Dict, Tuple
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 from sqlalchemy import create_engine, text
@@ -65,7 +66,17 @@ if DB_URL.startswith("postgres://"):
 def get_connection():
     """Cria e mantém a conexão com o banco de dados."""
     try:
-        return create_engine(DB_URL, pool_pre_ping=True)
+        return create_engine(
+            DB_URL,
+            pool_pre_ping=True,
+            # Várias sessões do Streamlit disparam queries ao mesmo tempo
+            pool_size=10,
+            max_overflow=20,
+            pool_recycle=300,
+            # LIFO mantém as conexões mais recentes (quentes) em uso
+            pool_use_lifo=True,
+            connect_args={"options": "-c statement_timeout=10000"},
+        )
     except Exception as e:
         st.error(f"❌ Erro crítico ao conectar no banco: {e}")
         st.stop()
@@ -75,9 +86,185 @@ def get_connection():
 # 📥 ETAPA 1: INGESTÃO DE DADOS (DATA LOADER)
 # =============================================================================
 
+# Linhas por bloco ao ler log_bot com cursor no servidor
+LOGS_CHUNKSIZE = 50_000
+
+# Validade do cache das cargas (segundos). Escritas feitas pelo próprio
+# dashboard limpam o cache na hora (ver ETAPA 5).
+CACHE_TTL_SEGUNDOS = 300
+
+# -----------------------------------------------------------------------------
+# Query 1: Logs de Atividade (com filtro temporal para performance)
+# Compiladas uma única vez no import, e não a cada carga
+# Só roda no fallback da Visão Macro (Query 3 falhou); cada bloco é agregado
+# por hora ao chegar, então não precisa de ORDER BY
+# -----------------------------------------------------------------------------
+SQL_LOGS = text(
+    """
+    SELECT
+        timestamp,
+        tipo,
+        lucro
+    FROM log_bot
+    WHERE timestamp >= :data_corte
+"""
+)
+
+# -----------------------------------------------------------------------------
+# Query 2: Base de Licenças (CRM completo)
+# -----------------------------------------------------------------------------
+SQL_LICENCAS = text(
+    """
+    SELECT
+        id,
+        cliente_nome,
+        chave,
+        hwid,
+        ativa,
+        data_expiracao,
+        email_cliente,
+        whatsapp,
+        telegram_chat_id,
+        plano_tipo,
+        payment_id,
+        created_at,
+        -- Status temporal calculado no banco (NOW() impede coluna GENERATED)
+        FLOOR(
+            EXTRACT(EPOCH FROM (data_expiracao - NOW())) / 86400
+        )::int AS dias_restantes,
+        CASE
+            WHEN data_expiracao IS NULL THEN '⚪ Sem Data'
+            WHEN data_expiracao < NOW() THEN '🔴 Vencida'
+            WHEN data_expiracao < NOW() + INTERVAL '4 days' THEN '🟡 Expirando'
+            ELSE '🟢 Ativa'
+        END AS status_tempo
+    FROM licenca
+    ORDER BY id DESC
+"""
+)
+
+# -----------------------------------------------------------------------------
+# Query 3: Lucro agregado por hora (Visão Macro)
+# -----------------------------------------------------------------------------
+SQL_LUCRO_HORARIO = text(
+    """
+    SELECT
+        date_trunc('hour', timestamp) AS hora,
+        SUM(lucro) AS lucro,
+        COUNT(*) AS operacoes,
+        COUNT(*) FILTER (WHERE tipo = 'bet') AS apostas,
+        COUNT(*) FILTER (WHERE tipo = 'error') AS erros
+    FROM log_bot
+    WHERE timestamp >= :data_corte
+    GROUP BY 1
+    ORDER BY 1
+"""
+)
+
+# -----------------------------------------------------------------------------
+# Query 4: Logs de um único cliente (Auditoria Individual)
+# -----------------------------------------------------------------------------
+SQL_LOGS_CLIENTE = text(
+    """
+    SELECT
+        timestamp,
+        tipo,
+        dados,
+        lucro,
+        SUM(COALESCE(lucro, 0)) OVER (ORDER BY timestamp) AS saldo_acumulado
+    FROM log_bot
+    WHERE hwid = :hwid
+      AND timestamp >= :data_corte
+    ORDER BY timestamp
+"""
+)
+
+
+def _como_datetime(serie: pd.Series) -> pd.Series:
+    """Helper: Converte para datetime só quando o driver não entregou o tipo pronto."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    return pd.to_datetime(serie, errors="coerce")
+
+
+def _ler_licencas(engine) -> pd.DataFrame:
+    """Helper: Lê a base de licenças (prepared statement)."""
+    with engine.connect() as conn:
+        return pd.read_sql(SQL_LICENCAS, conn)
+
+
+def _agregar_bloco_por_hora(bloco: pd.DataFrame) -> pd.DataFrame:
+    """Helper: Agrega um bloco de logs brutos por hora (formato da Query 3)."""
+    bloco["timestamp"] = _como_datetime(bloco["timestamp"])
+    bloco["lucro"] = pd.to_numeric(bloco["lucro"], errors="coerce").fillna(0)
+
+    return (
+        bloco.assign(apostas=bloco["tipo"] == "bet", erros=bloco["tipo"] == "error")
+        .groupby(pd.Grouper(key="timestamp", freq="h"))
+        .agg(
+            lucro=("lucro", "sum"),
+            operacoes=("lucro", "size"),
+            apostas=("apostas", "sum"),
+            erros=("erros", "sum"),
+        )
+    )
+
 
-@st.cache_data(ttl=60)
-def carregar_dados_crm(dias_analise: int) -> Tuple[pd.DataFrame, pd.DataFrame]:
+def _agregar_logs_por_hora(engine, data_corte: datetime) -> pd.DataFrame:
+    """
+    Helper: Lê os logs via cursor no servidor e agrega bloco a bloco.
+
+    Só os totais por hora ficam em memória, nunca o período inteiro de logs.
+    """
+    with engine.connect() as conn:
+        blocos_logs = pd.read_sql(
+            SQL_LOGS,
+            conn.execution_options(stream_results=True),
+            params={"data_corte": data_corte},
+            chunksize=LOGS_CHUNKSIZE,
+            # Colunas Arrow: cada bloco vira buffer tipado, sem array de objetos
+            dtype_backend="pyarrow",
+        )
+        parciais = [_agregar_bloco_por_hora(bloco) for bloco in blocos_logs]
+
+    if not parciais:
+        return pd.DataFrame(columns=["lucro", "operacoes", "apostas", "erros"])
+
+    # A mesma hora pode aparecer em vários blocos: soma os parciais
+    df_horario = pd.concat(parciais).groupby(level=0).sum()
+    # Como no GROUP BY do banco: só as horas que tiveram operação
+    df_horario = df_horario[df_horario["operacoes"] > 0]
+    df_horario.index.name = "hora"
+    return df_horario
+
+
+def _dados_crm_vazios() -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """Helper: DataFrame vazio com as colunas da carga, para quando o banco falha."""
+    df_licencas_vazio = pd.DataFrame(
+        columns=[
+            "id",
+            "cliente_nome",
+            "chave",
+            "hwid",
+            "ativa",
+            "data_expiracao",
+            "email_cliente",
+            "whatsapp",
+            "telegram_chat_id",
+            "plano_tipo",
+            "payment_id",
+            "status_tempo",
+            "dias_restantes",
+            "tem_whatsapp",
+            "tem_telegram",
+        ]
+    )
+    return df_licencas_vazio, {}
+
+
+# Erros sobem para quem chamou: falha do banco nunca fica no cache
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, show_spinner=False)
+def carregar_dados_crm() -> Tuple[pd.DataFrame, Dict[str, int]]:
     """
     🎯 ETAPA 1: Ingestão e Higienização de Dados
 
@@ -87,188 +274,148 @@ def carregar_dados_crm(dias_analise: int) -> Tuple[pd.DataFrame, pd.DataFrame]:
     - Calcular status temporal das licenças
     - Garantir tipos de dados corretos
 
+    Os logs não são baixados aqui: a Visão Macro usa só a agregação por
+    hora feita no banco (carregar_lucro_horario).
+
+    Returns:
+        Tuple[df_licencas, indice_clientes]: DataFrame limpo e o mapa nome do
+        cliente -> posição da licença mais recente em df_licencas
+    """
+
+    df_licencas = _ler_licencas(get_connection())
+
+    # =====================================================================
+    # 🧹 HIGIENIZAÇÃO DAS LICENÇAS
+    # =====================================================================
+    if not df_licencas.empty:
+        # Converte datas
+        df_licencas["data_expiracao"] = _como_datetime(df_licencas["data_expiracao"])
+
+        if "created_at" in df_licencas.columns:
+            df_licencas["created_at"] = _como_datetime(df_licencas["created_at"])
+
+        # Normaliza campos de contato e plano (importante para cálculos
+        # financeiros) numa única passada
+        df_licencas.fillna(
+            {
+                "whatsapp": "Não informado",
+                "telegram_chat_id": "Não informado",
+                "email_cliente": "Não informado",
+                "plano_tipo": "Não especificado",
+            },
+            inplace=True,
+        )
+
+        # Garante que ativa é booleano
+        df_licencas["ativa"] = (
+            df_licencas["ativa"].fillna(False).astype(bool, copy=False)
+        )
+
+        # status_tempo e dias_restantes já vêm calculados pelo banco
+        # (ver SQL_LICENCAS)
+
+        # ===============================================================
+        # 📊 ENRIQUECIMENTO: Adiciona flag de canal de contato
+        # ===============================================================
+        # bool NumPy (1 byte por linha, sem máscara de nulos): os &/~ do
+        # filtro de canal rodam direto sobre o buffer
+        df_licencas["tem_whatsapp"] = (
+            df_licencas["whatsapp"] != "Não informado"
+        ).to_numpy(dtype=bool)
+        df_licencas["tem_telegram"] = (
+            df_licencas["telegram_chat_id"] != "Não informado"
+        ).to_numpy(dtype=bool)
+
+        # Baixa cardinalidade -> category (filtros e value_counts mais leves)
+        df_licencas["plano_tipo"] = df_licencas["plano_tipo"].astype("category")
+        df_licencas["status_tempo"] = df_licencas["status_tempo"].astype("category")
+
+    # Mapa nome -> posição: busca O(1) do cliente na auditoria individual.
+    # Percorre de trás para frente para o nome repetido ficar com a licença
+    # mais recente (ORDER BY id DESC); as chaves já saem em ordem alfabética
+    nomes = df_licencas["cliente_nome"].tolist()
+    posicoes = dict(zip(reversed(nomes), range(len(nomes) - 1, -1, -1)))
+    indice_clientes = {nome: posicoes[nome] for nome in sorted(posicoes)}
+
+    return df_licencas, indice_clientes
+
+
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, show_spinner=False)
+def carregar_lucro_horario(dias_analise: int) -> pd.DataFrame:
+    """
+    Agrega o lucro hora a hora direto no PostgreSQL.
+
+    Apenas as linhas já agrupadas trafegam pela rede, em vez de todos os logs
+    brutos do período.
+
     Args:
         dias_analise: Número de dias para filtrar logs
 
     Returns:
-        Tuple[df_logs, df_licencas]: DataFrames limpos e prontos para uso
+        DataFrame indexado por hora com lucro, operações, apostas e erros
     """
 
     engine = get_connection()
     data_corte = datetime.now() - timedelta(days=dias_analise)
-    agora = datetime.now()
-
-    # -------------------------------------------------------------------------
-    # Query 1: Logs de Atividade (com filtro temporal para performance)
-    # -------------------------------------------------------------------------
-    sql_logs = """
-        SELECT
-            id,
-            timestamp,
-            tipo,
-            hwid,
-            lucro,
-            dados
-        FROM log_bot
-        WHERE timestamp >= :data_corte
-        ORDER BY timestamp DESC
+
+    with engine.connect() as conn:
+        df_horario = pd.read_sql(
+            SQL_LUCRO_HORARIO, conn, params={"data_corte": data_corte}
+        )
+
+    df_horario["lucro"] = pd.to_numeric(df_horario["lucro"], errors="coerce").fillna(0)
+
+    return df_horario.set_index("hora")
+
+
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, show_spinner=False)
+def carregar_lucro_horario_local(dias_analise: int) -> pd.DataFrame:
     """
+    Fallback de carregar_lucro_horario: agrega em pandas os logs do período.
 
-    # -------------------------------------------------------------------------
-    # Query 2: Base de Licenças (CRM completo)
-    # -------------------------------------------------------------------------
-    sql_licencas = """
-        SELECT
-            id,
-            cliente_nome,
-            chave,
-            hwid,
-            ativa,
-            data_expiracao,
-            email_cliente,
-            whatsapp,
-            telegram_chat_id,
-            plano_tipo,
-            payment_id,
-            created_at
-        FROM licenca
-        ORDER BY id DESC
+    Só roda quando a agregação no banco falha; devolve o mesmo formato.
     """
 
-    try:
-        with engine.connect() as conn:
-            # Carrega dados usando prepared statements (segurança contra SQL injection)
-            df_logs = pd.read_sql(
-                text(sql_logs), conn, params={"data_corte": data_corte}
-            )
-            df_licencas = pd.read_sql(text(sql_licencas), conn)
-
-        # =====================================================================
-        # 🧹 HIGIENIZAÇÃO DOS LOGS
-        # =====================================================================
-        if not df_logs.empty:
-            # Converte timestamp para datetime
-            df_logs["timestamp"] = pd.to_datetime(df_logs["timestamp"])
-
-            # Garante que lucro é numérico
-            df_logs["lucro"] = pd.to_numeric(df_logs["lucro"], errors="coerce").fillna(
-                0
-            )
+    engine = get_connection()
+    data_corte = datetime.now() - timedelta(days=dias_analise)
 
-            # Preenche campos vazios
-            df_logs["hwid"] = df_logs["hwid"].fillna("DESCONHECIDO")
-            df_logs["tipo"] = df_logs["tipo"].fillna("unknown")
-            df_logs["dados"] = df_logs["dados"].fillna("")
-
-        # =====================================================================
-        # 🧹 HIGIENIZAÇÃO DAS LICENÇAS
-        # =====================================================================
-        if not df_licencas.empty:
-            # Converte datas
-            df_licencas["data_expiracao"] = pd.to_datetime(
-                df_licencas["data_expiracao"], errors="coerce"
-            )
+    return _agregar_logs_por_hora(engine, data_corte)
 
-            if "created_at" in df_licencas.columns:
-                df_licencas["created_at"] = pd.to_datetime(
-                    df_licencas["created_at"], errors="coerce"
-                )
 
-            # Normaliza campos de contato (preenche vazios)
-            df_licencas["whatsapp"] = df_licencas["whatsapp"].fillna("Não informado")
-            df_licencas["telegram_chat_id"] = df_licencas["telegram_chat_id"].fillna(
-                "Não informado"
-            )
-            df_licencas["email_cliente"] = df_licencas["email_cliente"].fillna(
-                "Não informado"
-            )
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, show_spinner=False)
+def carregar_logs_cliente(hwid: str, dias_analise: int) -> pd.DataFrame:
+    """
+    Busca apenas os logs de um HWID, com o saldo acumulado calculado no banco.
 
-            # Normaliza plano (importante para cálculos financeiros)
-            df_licencas["plano_tipo"] = df_licencas["plano_tipo"].fillna(
-                "Não especificado"
-            )
+    Usa o índice composto idx_log_bot_hwid_ts (ver queries_sql.MD).
 
-            # Garante que ativa é booleano
-            df_licencas["ativa"] = df_licencas["ativa"].fillna(False).astype(bool)
-
-            # # ===============================================================
-            # 🎯 CÁLCULO DE STATUS TEMPORAL (CORRIGIDO)
-            # ===============================================================
-
-            # 1. Cria 'agora' como Timestamp do Pandas (Inteligente com Fuso)
-            tem_fuso = df_licencas["data_expiracao"].dt.tz is not None
-            agora = pd.Timestamp.now(tz="UTC" if tem_fuso else None)
-
-            def calcular_status(row):
-                val_expira = row["data_expiracao"]
-
-                if pd.isna(val_expira):
-                    return "⚪ Sem Data"
-
-                # 2. Cálculo seguro linha a linha
-                try:
-                    dias = (val_expira - agora).days
-                except TypeError:
-                    # Fallback: Se der conflito de fuso, remove de ambos e calcula cru
-                    dias = (
-                        val_expira.replace(tzinfo=None) - agora.replace(tzinfo=None)
-                    ).days
-
-                if dias < 0:
-                    return "🔴 Vencida"
-                elif dias <= 3:
-                    return "🟡 Expirando"
-                else:
-                    return "🟢 Ativa"
-
-            # Aplica a função de status
-            df_licencas["status_tempo"] = df_licencas.apply(calcular_status, axis=1)
-
-            # 3. CORREÇÃO PYLANCE: Cálculo vetorizado explícito
-            # Convertemos a coluna para datetime novamente apenas para garantir ao Pylance que é data
-            datas_garantidas = pd.to_datetime(
-                df_licencas["data_expiracao"], utc=tem_fuso
-            )
-            df_licencas["dias_restantes"] = (datas_garantidas - agora).dt.days
-
-            # ===============================================================
-            # 📊 ENRIQUECIMENTO: Adiciona flag de canal de contato
-            # ===============================================================
-            df_licencas["tem_whatsapp"] = df_licencas["whatsapp"] != "Não informado"
-            df_licencas["tem_telegram"] = (
-                df_licencas["telegram_chat_id"] != "Não informado"
-            )
+    Args:
+        hwid: HWID vinculado à licença do cliente
+        dias_analise: Número de dias para filtrar logs
 
-        return df_logs, df_licencas
+    Returns:
+        DataFrame em ordem cronológica com a coluna saldo_acumulado
+    """
 
-    except Exception as e:
-        st.error(f"⚠️ Erro ao buscar dados no banco: {e}")
-        st.error(f"Detalhes técnicos: {str(e)}")
+    engine = get_connection()
+    data_corte = datetime.now() - timedelta(days=dias_analise)
 
-        # Retorna DataFrames vazios estruturados
-        df_logs_vazio = pd.DataFrame(
-            columns=["id", "timestamp", "tipo", "hwid", "lucro", "dados"]
+    with engine.connect() as conn:
+        df_cliente = pd.read_sql(
+            SQL_LOGS_CLIENTE,
+            conn,
+            params={"hwid": hwid, "data_corte": data_corte},
         )
-        df_licencas_vazio = pd.DataFrame(
-            columns=[
-                "id",
-                "cliente_nome",
-                "chave",
-                "hwid",
-                "ativa",
-                "data_expiracao",
-                "email_cliente",
-                "whatsapp",
-                "telegram_chat_id",
-                "plano_tipo",
-                "payment_id",
-                "status_tempo",
-                "dias_restantes",
-                "tem_whatsapp",
-                "tem_telegram",
-            ]
-        )
-        return df_logs_vazio, df_licencas_vazio
+
+    if not df_cliente.empty:
+        df_cliente["timestamp"] = _como_datetime(df_cliente["timestamp"])
+        df_cliente["lucro"] = pd.to_numeric(
+            df_cliente["lucro"], errors="coerce"
+        ).fillna(0)
+        df_cliente["tipo"] = df_cliente["tipo"].fillna("unknown").astype("category")
+        df_cliente["dados"] = df_cliente["dados"].fillna("")
+
+    return df_cliente
 
 
 # =============================================================================
@@ -296,6 +443,8 @@ def _calcular_metricas_financeiras(df_licencas: pd.DataFrame) -> dict:
 
     # Cálculos
     distribuicao_planos = df_licencas[df_licencas["ativa"]]["plano_tipo"].value_counts()
+    # Em colunas category, value_counts inclui planos sem nenhuma venda
+    distribuicao_planos = distribuicao_planos[distribuicao_planos > 0]
 
     faturamento_total = sum(
         distribuicao_planos.get(plano, 0) * preco
@@ -315,9 +464,13 @@ def _calcular_metricas_financeiras(df_licencas: pd.DataFrame) -> dict:
     }
 
 
-def _calcular_metricas_operacionais(df_logs: pd.DataFrame) -> dict:
-    """Helper: Calcula apenas as métricas operacionais dos bots."""
-    if df_logs.empty:
+def _calcular_metricas_operacionais(df_horario: pd.DataFrame) -> dict:
+    """
+    Helper: Calcula apenas as métricas operacionais dos bots.
+
+    Usa os totais já agregados por hora (mesma consulta do gráfico).
+    """
+    if df_horario.empty:
         return {
             "lucro_rede": 0,
             "total_apostas": 0,
@@ -326,38 +479,57 @@ def _calcular_metricas_operacionais(df_logs: pd.DataFrame) -> dict:
             "taxa_erro": 0,
         }
 
-    total_operacoes = len(df_logs)
-    total_erros = len(df_logs[df_logs["tipo"] == "error"])
+    lucro_rede = df_horario["lucro"].sum()
+    total_operacoes = int(df_horario["operacoes"].sum())
+    total_apostas = int(df_horario["apostas"].sum())
+    total_erros = int(df_horario["erros"].sum())
 
     taxa_erro = (total_erros / total_operacoes * 100) if total_operacoes > 0 else 0
 
     return {
-        "lucro_rede": df_logs["lucro"].sum(),
-        "total_apostas": len(df_logs[df_logs["tipo"] == "bet"]),
+        "lucro_rede": lucro_rede,
+        "total_apostas": total_apostas,
         "total_erros": total_erros,
         "total_operacoes": total_operacoes,
         "taxa_erro": taxa_erro,
     }
 
 
-def calcular_metricas_macro(df_logs: pd.DataFrame, df_licencas: pd.DataFrame) -> dict:
+def calcular_metricas_macro(
+    df_licencas: pd.DataFrame, df_horario: pd.DataFrame
+) -> dict:
     """
     ETAPA 2: Cálculos Financeiros e Operacionais Globais
     (Agora refatorada para usar helpers, deixando o Sourcery feliz)
     """
     # Combina os dois dicionários em um só
     metricas_fin = _calcular_metricas_financeiras(df_licencas)
-    metricas_ops = _calcular_metricas_operacionais(df_logs)
+    metricas_ops = _calcular_metricas_operacionais(df_horario)
 
     return {**metricas_fin, **metricas_ops}
 
 
-def renderizar_visao_macro(df_logs: pd.DataFrame, df_licencas: pd.DataFrame):
+def renderizar_visao_macro(df_licencas: pd.DataFrame, dias_analise: int):
     """Renderiza a aba de Visão Macro (Dono)."""
 
     st.markdown("### 📊 Saúde Financeira do Sistema")
 
-    metricas = calcular_metricas_macro(df_logs, df_licencas)
+    # Agregação por hora feita no banco (GROUP BY date_trunc): alimenta os
+    # KPIs operacionais e o gráfico de tendência numa única ida ao banco
+    try:
+        df_horario = carregar_lucro_horario(dias_analise)
+    except Exception as e:
+        # Só aqui os logs brutos são baixados (agregação feita em pandas)
+        st.warning(f"⚠️ Erro ao agregar lucro por hora no banco: {e}")
+        try:
+            df_horario = carregar_lucro_horario_local(dias_analise)
+        except Exception as e:
+            st.error(f"⚠️ Erro ao buscar logs no banco: {e}")
+            df_horario = pd.DataFrame(
+                columns=["lucro", "operacoes", "apostas", "erros"]
+            )
+
+    metricas = calcular_metricas_macro(df_licencas, df_horario)
 
     # -------------------------------------------------------------------------
     # 💳 CARTÕES DE MÉTRICAS FINANCEIRAS
@@ -446,15 +618,10 @@ def renderizar_visao_macro(df_logs: pd.DataFrame, df_licencas: pd.DataFrame):
     # 📈 GRÁFICO: TENDÊNCIA DE LUCRO GLOBAL
     # -------------------------------------------------------------------------
 
-    if not df_logs.empty:
+    if not df_horario.empty:
         st.divider()
         st.markdown("#### 📈 Tendência de Lucro Global (Hora a Hora)")
-
-        # Agrupa por hora e soma o lucro
-        df_chart = df_logs.copy()
-        chart_data = df_chart.set_index("timestamp").resample("h")["lucro"].sum()
-
-        st.area_chart(chart_data, color="#00FFA3")
+        st.area_chart(df_horario["lucro"], color="#00FFA3")
     else:
         st.info("📊 Nenhum log registrado no período. Os bots ainda não operaram.")
 
@@ -464,7 +631,11 @@ def renderizar_visao_macro(df_logs: pd.DataFrame, df_licencas: pd.DataFrame):
 # =============================================================================
 
 
-def renderizar_auditoria_individual(df_logs: pd.DataFrame, df_licencas: pd.DataFrame):
+# Fragmento: trocar o cliente reexecuta só esta aba, não o main() inteiro
+@st.fragment
+def renderizar_auditoria_individual(
+    df_licencas: pd.DataFrame, indice_clientes: Dict[str, int], dias_analise: int
+):
     """
     🎯 ETAPA 3: Análise Detalhada por Cliente
 
@@ -484,10 +655,8 @@ def renderizar_auditoria_individual(df_logs: pd.DataFrame, df_licencas: pd.DataF
     # 🔍 SELETOR DE CLIENTE
     # -------------------------------------------------------------------------
 
-    lista_clientes = sorted(df_licencas["cliente_nome"].unique().tolist())
-
     cliente_selecionado = st.selectbox(
-        "🔎 Pesquise ou Selecione o Cliente:", ["Selecione..."] + lista_clientes
+        "🔎 Pesquise ou Selecione o Cliente:", ["Selecione...", *indice_clientes]
     )
 
     if cliente_selecionado == "Selecione...":
@@ -498,9 +667,7 @@ def renderizar_auditoria_individual(df_logs: pd.DataFrame, df_licencas: pd.DataF
     # 📋 RECUPERA DADOS DO CLIENTE
     # -------------------------------------------------------------------------
 
-    dados_cliente = df_licencas[
-        df_licencas["cliente_nome"] == cliente_selecionado
-    ].iloc[0]
+    dados_cliente = df_licencas.iloc[indice_clientes[cliente_selecionado]]
 
     hwid_alvo = dados_cliente["hwid"]
     email = dados_cliente["email_cliente"]
@@ -533,14 +700,17 @@ def renderizar_auditoria_individual(df_logs: pd.DataFrame, df_licencas: pd.DataF
     st.divider()
 
     # -------------------------------------------------------------------------
-    # 📊 FILTRA LOGS DESSE CLIENTE (HWID)
+    # 📊 BUSCA LOGS DESSE CLIENTE (HWID) DIRETO NO BANCO
     # -------------------------------------------------------------------------
 
-    if df_logs.empty:
-        st.warning("⚠️ Não há logs globais para filtrar.")
-        return
-
-    df_cliente = df_logs[df_logs["hwid"] == hwid_alvo].copy()
+    if pd.isna(hwid_alvo):
+        df_cliente = pd.DataFrame()
+    else:
+        try:
+            df_cliente = carregar_logs_cliente(hwid_alvo, dias_analise)
+        except Exception as e:
+            st.error(f"⚠️ Erro ao buscar logs do cliente: {e}")
+            return
 
     if df_cliente.empty:
         st.warning(
@@ -558,7 +728,7 @@ def renderizar_auditoria_individual(df_logs: pd.DataFrame, df_licencas: pd.DataF
 
     lucro_cliente = df_cliente["lucro"].sum()
     total_ops = len(df_cliente)
-    total_apostas_cli = len(df_cliente[df_cliente["tipo"] == "bet"])
+    total_apostas_cli = int(df_cliente["tipo"].value_counts().get("bet", 0))
 
     k1, k2, k3, k4 = st.columns(4)
 
@@ -582,10 +752,9 @@ def renderizar_auditoria_individual(df_logs: pd.DataFrame, df_licencas: pd.DataF
 
     st.markdown("#### 📉 Evolução do Lucro (Acumulado)")
 
-    df_cliente = df_cliente.sort_values("timestamp")
-    df_cliente["saldo_acumulado"] = df_cliente["lucro"].cumsum()
-
-    st.line_chart(df_cliente.set_index("timestamp")["saldo_acumulado"], color="#00FFA3")
+    # saldo_acumulado já vem calculado pelo banco (SUM ... OVER)
+    # x/y apontam as colunas direto, sem set_index copiando o DataFrame
+    st.line_chart(df_cliente, x="timestamp", y="saldo_acumulado", color="#00FFA3")
 
     # -------------------------------------------------------------------------
     # 📜 TABELA DETALHADA (LOG DE AUDITORIA)
@@ -613,6 +782,32 @@ def renderizar_auditoria_individual(df_logs: pd.DataFrame, df_licencas: pd.DataF
 # =============================================================================
 
 
+# Linhas por página na tabela do CRM (o CSV exporta o recorte inteiro)
+CRM_LINHAS_POR_PAGINA = 200
+
+# Colunas exibidas na tabela do CRM (lista fixa, montada uma vez no import)
+COLUNAS_CRM = [
+    "cliente_nome",
+    "status_tempo",
+    "plano_tipo",
+    "dias_restantes",
+    "whatsapp",
+    "telegram_chat_id",
+    "email_cliente",
+    "chave",
+    "ativa",
+]
+
+
+# Poucos recortes em memória: cada entrada guarda o CSV inteiro em bytes
+@st.cache_data(ttl=CACHE_TTL_SEGUNDOS, max_entries=4, show_spinner=False)
+def _exportar_csv(df: pd.DataFrame) -> bytes:
+    """Helper: Codifica o CSV de exportação só quando o recorte muda."""
+    return df.to_csv(index=False).encode("utf-8")
+
+
+# Fragmento: filtros e paginação reexecutam só esta aba, não o main() inteiro
+@st.fragment
 def renderizar_crm(df_licencas: pd.DataFrame):
     """
     🎯 ETAPA 4: Gestão de Base de Clientes e Canais de Contato
@@ -634,20 +829,24 @@ def renderizar_crm(df_licencas: pd.DataFrame):
     # 🔍 FILTROS INTERATIVOS
     # -------------------------------------------------------------------------
 
+    # Valores distintos calculados uma vez (servem de opções e de padrão)
+    opcoes_status = df_licencas["status_tempo"].unique()
+    opcoes_plano = df_licencas["plano_tipo"].unique()
+
     col_f1, col_f2, col_f3 = st.columns(3)
 
     with col_f1:
         filtro_status = st.multiselect(
             "Status:",
-            options=df_licencas["status_tempo"].unique(),
-            default=df_licencas["status_tempo"].unique(),
+            options=opcoes_status,
+            default=opcoes_status,
         )
 
     with col_f2:
         filtro_plano = st.multiselect(
             "Plano:",
-            options=df_licencas["plano_tipo"].unique(),
-            default=df_licencas["plano_tipo"].unique(),
+            options=opcoes_plano,
+            default=opcoes_plano,
         )
 
     with col_f3:
@@ -660,24 +859,31 @@ def renderizar_crm(df_licencas: pd.DataFrame):
     # 🎯 APLICA FILTROS
     # -------------------------------------------------------------------------
 
-    df_filtrado = df_licencas[
-        (df_licencas["status_tempo"].isin(filtro_status))
-        & (df_licencas["plano_tipo"].isin(filtro_plano))
-    ].copy()
+    # Uma única máscara booleana (NumPy) e um único .loc, sem cópias intermediárias
+    mascara = np.logical_and(
+        df_licencas["status_tempo"].isin(filtro_status).to_numpy(),
+        df_licencas["plano_tipo"].isin(filtro_plano).to_numpy(),
+    )
 
     # Filtro de canal
+    tem_whatsapp = df_licencas["tem_whatsapp"].to_numpy()
+    tem_telegram = df_licencas["tem_telegram"].to_numpy()
+
     if filtro_canal == "Tem WhatsApp":
-        df_filtrado = df_filtrado[df_filtrado["tem_whatsapp"]]
+        mascara &= tem_whatsapp
     elif filtro_canal == "Tem Telegram":
-        df_filtrado = df_filtrado[df_filtrado["tem_telegram"]]
+        mascara &= tem_telegram
     elif filtro_canal == "Ambos":
-        df_filtrado = df_filtrado[
-            (df_filtrado["tem_whatsapp"]) & (df_filtrado["tem_telegram"])
-        ]
+        mascara &= tem_whatsapp & tem_telegram
     elif filtro_canal == "Nenhum":
-        df_filtrado = df_filtrado[
-            (~df_filtrado["tem_whatsapp"]) & (~df_filtrado["tem_telegram"])
-        ]
+        mascara &= ~tem_whatsapp & ~tem_telegram
+
+    df_filtrado = df_licencas.loc[mascara]
+
+    # Filtro sem resultado: nada para resumir, exibir ou exportar
+    if df_filtrado.empty:
+        st.warning("⚠️ Nenhum cliente bate com os filtros.")
+        return
 
     # -------------------------------------------------------------------------
     # 📊 ESTATÍSTICAS RÁPIDAS
@@ -699,20 +905,21 @@ def renderizar_crm(df_licencas: pd.DataFrame):
     # 📋 TABELA PRINCIPAL
     # -------------------------------------------------------------------------
 
+    # Só a página atual vai para o navegador; bases grandes não travam a aba
+    total_paginas = -(-total_filtrado // CRM_LINHAS_POR_PAGINA)
+    pagina = 1
+    if total_paginas > 1:
+        pagina = st.number_input(
+            f"Página (de {total_paginas}):",
+            min_value=1,
+            max_value=total_paginas,
+            value=1,
+            step=1,
+        )
+    inicio = (pagina - 1) * CRM_LINHAS_POR_PAGINA
+
     st.dataframe(
-        df_filtrado[
-            [
-                "cliente_nome",
-                "status_tempo",
-                "plano_tipo",
-                "dias_restantes",
-                "whatsapp",
-                "telegram_chat_id",
-                "email_cliente",
-                "chave",
-                "ativa",
-            ]
-        ],
+        df_filtrado.iloc[inicio : inicio + CRM_LINHAS_POR_PAGINA].loc[:, COLUNAS_CRM],
         use_container_width=True,
         hide_index=True,
         column_config={
@@ -739,7 +946,7 @@ def renderizar_crm(df_licencas: pd.DataFrame):
     col_exp1, col_exp2 = st.columns([3, 1])
 
     with col_exp2:
-        csv = df_filtrado.to_csv(index=False).encode("utf-8")
+        csv = _exportar_csv(df_filtrado)
         st.download_button(
             label="📥 Exportar para CSV",
             data=csv,
@@ -778,7 +985,7 @@ def _renderizar_aba_gerar_licenca(engine):
                 return
 
             # Lógica de Geração
-            chave = f"KEY-{str(uuid.uuid4()).upper()[:14]}"
+            chave = f"KEY-{uuid.uuid4().hex[:14].upper()}"
             payment_id_fake = f"MANUAL-{uuid.uuid4().hex[:8]}"
             data_expiracao = datetime.now() + timedelta(days=dias)
 
@@ -814,6 +1021,7 @@ def _renderizar_aba_gerar_licenca(engine):
             try:
                 with engine.begin() as conn:
                     conn.execute(sql_insert, params)
+                st.cache_data.clear()
                 st.success("✅ Licença criada com sucesso!")
                 st.code(chave, language="text")
             except Exception as e:
@@ -878,6 +1086,7 @@ def _renderizar_aba_cancelar_licenca(engine):
                             text("UPDATE licenca SET ativa = FALSE WHERE id = :id"),
                             {"id": int(licenca["id"])},
                         )
+                    st.cache_data.clear()
                     st.rerun()
             else:
                 st.info("Esta licença já está bloqueada.")
@@ -892,6 +1101,7 @@ def _renderizar_aba_cancelar_licenca(engine):
                             text("UPDATE licenca SET ativa = TRUE WHERE id = :id"),
                             {"id": int(licenca["id"])},
                         )
+                    st.cache_data.clear()
                     st.rerun()
             else:
                 st.info("Esta licença já está ativa.")
@@ -957,8 +1167,12 @@ def main():
     # 📥 CARREGAMENTO DE DADOS (ETAPA 1)
     # -------------------------------------------------------------------------
 
-    with st.spinner(f"🔄 Carregando dados dos últimos {filtro_dias} dias..."):
-        df_logs, df_licencas = carregar_dados_crm(filtro_dias)
+    with st.spinner("🔄 Carregando licenças..."):
+        try:
+            df_licencas, indice_clientes = carregar_dados_crm()
+        except Exception as e:
+            st.error(f"⚠️ Erro ao buscar dados no banco: {e}")
+            df_licencas, indice_clientes = _dados_crm_vazios()
 
     # -------------------------------------------------------------------------
     # 🎨 HEADER PRINCIPAL
@@ -984,11 +1198,11 @@ def main():
 
     # ETAPA 2: Visão Macro
     with tab1:
-        renderizar_visao_macro(df_logs, df_licencas)
+        renderizar_visao_macro(df_licencas, filtro_dias)
 
     # ETAPA 3: Auditoria Individual
     with tab2:
-        renderizar_auditoria_individual(df_logs, df_licencas)
+        renderizar_auditoria_individual(df_licencas, indice_clientes, filtro_dias)
 
     # ETAPA 4: CRM
     with tab3:
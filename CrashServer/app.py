@@ -11,21 +11,41 @@ Melhorias da V2:
 - Tratamento de erros aprimorado
 """
 
+import atexit
+import hashlib
+import hmac
 import logging
 import os
 import secrets
-import uuid
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from functools import wraps
+from functools import lru_cache, wraps
 from typing import Optional, Tuple
 
 import mercadopago
+import orjson
+import redis
+import requests
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from flask import Flask, Response, jsonify, request  # Removido 'abort'
+from flask import Flask, Response, abort, g, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from flask_caching import Cache
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func, select
+from mercadopago.config import RequestOptions
+from mercadopago.http.http_client import HttpClient
+from requests.adapters import HTTPAdapter
+from sqlalchemy import delete, func, insert, literal, select, text, true, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+from urllib3.util.retry import Retry
 from werkzeug.security import check_password_hash, generate_password_hash
 
 load_dotenv()
@@ -33,8 +53,10 @@ load_dotenv()
 # CONFIGURAÇÃO DE LOGGING
 # =============================================================================
 
+# Em produção fica em INFO: chamadas debug() dos caminhos quentes são
+# descartadas pelo próprio logging antes de formatar a mensagem
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
 )
@@ -65,7 +87,29 @@ except ImportError:
 # INICIALIZAÇÃO DO FLASK
 # =============================================================================
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON do Flask via orjson (extensão C) em jsonify e request.get_json.
+
+    Mantém a saída do provider padrão: chaves ordenadas, indentação no modo
+    debug e datetime/Decimal/UUID pelo mesmo fallback (self.default).
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        opcoes = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys", self.sort_keys):
+            opcoes |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            opcoes |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=opcoes).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config["JSON_SORT_KEYS"] = False
 
 # =============================================================================
@@ -73,6 +117,12 @@ app.config["JSON_SORT_KEYS"] = False
 # =============================================================================
 
 
+@lru_cache(maxsize=1)
+def _hash_senha_admin_padrao() -> str:
+    """Gera o hash da senha padrão uma única vez (PBKDF2 é caro no import)."""
+    return generate_password_hash("admin123")
+
+
 class Config:
     """Centraliza todas as configurações da aplicação."""
 
@@ -91,16 +141,58 @@ class Config:
 
     # Segurança
     ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
-    ADMIN_PASSWORD_HASH = os.getenv(
-        "ADMIN_PASSWORD_HASH",
-        # Hash de "admin123" - TROCAR EM PRODUÇÃO!
-        generate_password_hash("admin123"),
-    )
+    # None = senha padrão "admin123" (hash gerado sob demanda) - TROCAR EM PRODUÇÃO!
+    ADMIN_PASSWORD_HASH = os.getenv("ADMIN_PASSWORD_HASH")
     SECRET_KEY = os.getenv("SECRET_KEY", secrets.token_hex(32))
+    # Token do header X-Admin-Token exigido pelo reset do banco. Sem ele
+    # configurado a rota de reset fica desligada (404)
+    ADMIN_RESET_TOKEN = os.getenv("ADMIN_RESET_TOKEN")
 
     # Rate Limiting
     RATELIMIT_ENABLED = os.getenv("RATELIMIT_ENABLED", "true").lower() == "true"
+    # memory:// conta por worker; com gunicorn use redis://... (contagem única)
     RATELIMIT_STORAGE_URL = os.getenv("RATELIMIT_STORAGE_URL", "memory://")
+    # Janela deslizante: no Redis cada decisão é um único script Lua atômico
+    RATELIMIT_STRATEGY = os.getenv("RATELIMIT_STRATEGY", "moving-window")
+
+    # Cache (SimpleCache por processo; RedisCache compartilha entre workers).
+    # Com REDIS_URL definido (add-on do Render) o Redis vira o padrão: uma
+    # revalidação custa um GET sub-ms em vez de um SELECT no Postgres
+    CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL") or os.getenv("REDIS_URL")
+    CACHE_TYPE = os.getenv(
+        "CACHE_TYPE", "RedisCache" if CACHE_REDIS_URL else "SimpleCache"
+    )
+    CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "crashbot:")
+    # Cache L1 na memória do worker, na frente do Redis (só usado com cache
+    # compartilhado). TTL curto: bloqueio feito em outro worker vale em segundos
+    CACHE_LICENCA_LOCAL_TIMEOUT = int(os.getenv("CACHE_LICENCA_LOCAL_TIMEOUT", "5"))
+    CACHE_LICENCA_LOCAL_MAX = int(os.getenv("CACHE_LICENCA_LOCAL_MAX", "10000"))
+    CACHE_LICENCA_TIMEOUT = int(os.getenv("CACHE_LICENCA_TIMEOUT", "60"))
+    CACHE_ESTATISTICAS_TIMEOUT = int(os.getenv("CACHE_ESTATISTICAS_TIMEOUT", "30"))
+
+    # Tempo máximo (segundos) de uma chamada à API do Mercado Pago: um MP lento
+    # não segura o worker do webhook por até 60s (padrão do SDK)
+    MP_TIMEOUT_SEGUNDOS = float(os.getenv("MP_TIMEOUT_SEGUNDOS", "5"))
+
+    # Telemetria: logs gravados em lote (um commit a cada N linhas ou T segundos)
+    TELEMETRIA_LOTE_MAX = int(os.getenv("TELEMETRIA_LOTE_MAX", "200"))
+    TELEMETRIA_FLUSH_SEGUNDOS = float(os.getenv("TELEMETRIA_FLUSH_SEGUNDOS", "0.5"))
+    # Falhas seguidas do lote antes de gravar log a log (o log que o banco
+    # recusa vai para a dead-letter em vez de travar a fila inteira)
+    TELEMETRIA_TENTATIVAS_LOTE = int(os.getenv("TELEMETRIA_TENTATIVAS_LOTE", "3"))
+    # Com Redis a fila é compartilhada entre workers e sobrevive a um restart
+    # do processo; sem ele a fila fica em memória em cada worker
+    TELEMETRIA_REDIS_URL = os.getenv("TELEMETRIA_REDIS_URL") or os.getenv("REDIS_URL")
+    TELEMETRIA_REDIS_CHAVE = os.getenv("TELEMETRIA_REDIS_CHAVE", "crashbot:fila_logs")
+    # Retenção de log_bot em dias (0 = guarda tudo). A poda roda na thread de
+    # telemetria no máximo uma vez por intervalo, apagando em lotes pequenos
+    TELEMETRIA_RETENCAO_DIAS = int(os.getenv("TELEMETRIA_RETENCAO_DIAS", "0"))
+    TELEMETRIA_PODA_INTERVALO = float(os.getenv("TELEMETRIA_PODA_INTERVALO", "3600"))
+    TELEMETRIA_PODA_LOTE = int(os.getenv("TELEMETRIA_PODA_LOTE", "5000"))
+    # Janela (segundos) em que um reenvio com o mesmo Idempotency-Key é ignorado
+    TELEMETRIA_IDEMPOTENCIA_SEGUNDOS = int(
+        os.getenv("TELEMETRIA_IDEMPOTENCIA_SEGUNDOS", "60")
+    )
 
     # Banco de Dados
     @staticmethod
@@ -118,6 +210,35 @@ class Config:
 
         return database_url
 
+    @staticmethod
+    def get_engine_options(database_uri: str) -> dict:
+        """Pool de conexões reaproveitadas (sem handshake TCP/auth por requisição)."""
+        opcoes = {
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "20")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "300")),
+            "pool_pre_ping": True,
+            "pool_timeout": 5,
+        }
+
+        # PgBouncer em modo transação (hostname "-pooler" no Render) recusa
+        # parâmetros de inicialização como "options"
+        usa_pooler = (
+            os.getenv("DB_USA_POOLER", "false").lower() == "true"
+            or "-pooler" in database_uri
+        )
+
+        # Limite de tempo por consulta (opção do servidor PostgreSQL)
+        if database_uri.startswith("postgresql") and not usa_pooler:
+            opcoes["connect_args"] = {"options": "-c statement_timeout=5000"}
+
+        return opcoes
+
+    @classmethod
+    def get_admin_password_hash(cls) -> str:
+        """Retorna o hash da senha admin, gerando o padrão só no primeiro uso."""
+        return cls.ADMIN_PASSWORD_HASH or _hash_senha_admin_padrao()
+
     # Tabela de Preços (Centralizada)
     PRECOS_PLANOS = {
         "experimental": {
@@ -145,7 +266,10 @@ class Config:
         if not cls.MP_ACCESS_TOKEN:
             erros.append("MP_ACCESS_TOKEN não configurado")
 
-        if cls.ADMIN_PASSWORD_HASH == generate_password_hash("admin123"):
+        # Hash tem salt: compara verificando a senha, não gerando outro hash
+        if cls.ADMIN_PASSWORD_HASH is None or check_password_hash(
+            cls.ADMIN_PASSWORD_HASH, "admin123"
+        ):
             logger.warning("⚠️ SENHA ADMIN PADRÃO DETECTADA - TROCAR EM PRODUÇÃO!")
 
         if erros:
@@ -158,6 +282,9 @@ class Config:
 
 # Aplicar configurações ao Flask
 app.config["SQLALCHEMY_DATABASE_URI"] = Config.get_database_uri()
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = Config.get_engine_options(
+    app.config["SQLALCHEMY_DATABASE_URI"]
+)
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SECRET_KEY"] = Config.SECRET_KEY
 
@@ -173,10 +300,65 @@ limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     storage_uri=Config.RATELIMIT_STORAGE_URL,
+    strategy=Config.RATELIMIT_STRATEGY,
     default_limits=["200 per day", "50 per hour"],
     enabled=Config.RATELIMIT_ENABLED,
 )
 
+
+class HttpClientPersistente(HttpClient):
+    """
+    Cliente HTTP do SDK do Mercado Pago com uma única requests.Session.
+
+    O HttpClient padrão abre uma Session (e um handshake TLS) a cada chamada;
+    aqui o pool de conexões HTTPS fica aberto entre webhooks e checkouts.
+    """
+
+    def __init__(self):
+        self._session = requests.Session()
+        self._session.mount(
+            "https://",
+            HTTPAdapter(
+                pool_connections=10,
+                pool_maxsize=20,
+                max_retries=Retry(total=3, status_forcelist=[429, 500, 502, 503, 504]),
+            ),
+        )
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        api_result = self._session.request(method, url, **kwargs)
+        response = {"status": api_result.status_code, "response": None}
+
+        if api_result.status_code != 204 and api_result.content:
+            try:
+                response["response"] = api_result.json()
+            except ValueError as e:
+                logger.error(f"❌ Resposta do Mercado Pago não é JSON: {e}")
+
+        return response
+
+
+# SDK do Mercado Pago (uma instância por processo; None sem token configurado)
+MP_SDK = (
+    mercadopago.SDK(
+        Config.MP_ACCESS_TOKEN,
+        http_client=HttpClientPersistente(),
+        request_options=RequestOptions(connection_timeout=Config.MP_TIMEOUT_SEGUNDOS),
+    )
+    if Config.MP_ACCESS_TOKEN
+    else None
+)
+
+# Cache (consultas quentes do bot, invalidado a cada escrita)
+cache = Cache(
+    app,
+    config={
+        "CACHE_TYPE": Config.CACHE_TYPE,
+        "CACHE_REDIS_URL": Config.CACHE_REDIS_URL,
+        "CACHE_KEY_PREFIX": Config.CACHE_KEY_PREFIX,
+    },
+)
+
 # =============================================================================
 # MODELOS DO BANCO DE DADOS
 # =============================================================================
@@ -229,8 +411,8 @@ class Licenca(db.Model):
         else:
             self.data_expiracao = None
 
-    def esta_expirada(self) -> bool:
-        """Verifica se a licença está expirada."""
+    def esta_expirada(self, agora: Optional[datetime] = None) -> bool:
+        """Verifica se a licença está expirada (agora: relógio já lido, opcional)."""
         if not self.data_expiracao:
             return False
 
@@ -238,10 +420,10 @@ class Licenca(db.Model):
         if exp.tzinfo is None:
             exp = exp.replace(tzinfo=timezone.utc)
 
-        return exp < datetime.now(timezone.utc)
+        return exp < (agora or datetime.now(timezone.utc))
 
-    def dias_restantes(self) -> int:
-        """Retorna quantos dias faltam para expirar."""
+    def dias_restantes(self, agora: Optional[datetime] = None) -> int:
+        """Retorna quantos dias faltam para expirar (agora: relógio já lido, opcional)."""
         if not self.data_expiracao:
             return 999999
 
@@ -249,7 +431,7 @@ class Licenca(db.Model):
         if exp.tzinfo is None:
             exp = exp.replace(tzinfo=timezone.utc)
 
-        delta = exp - datetime.now(timezone.utc)
+        delta = exp - (agora or datetime.now(timezone.utc))
         return max(0, delta.days)
 
     def to_dict(self) -> dict:
@@ -282,9 +464,11 @@ class LogBot(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     sessao_id = db.Column(db.String(100), nullable=False, index=True)
+    # Preenchido pelo banco (now()) quando não vem no INSERT; a telemetria
+    # em lote já manda a hora de recebimento explicitamente
     timestamp = db.Column(
         db.DateTime(timezone=True),
-        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
         nullable=False,
         index=True,
     )
@@ -293,6 +477,9 @@ class LogBot(db.Model):
     dados = db.Column(db.Text, nullable=True)
     lucro = db.Column(db.Float, default=0.0, nullable=False)
 
+    # Auditoria por cliente no dashboard: WHERE hwid = ... AND timestamp >= ...
+    __table_args__ = (db.Index("idx_log_bot_hwid_ts", hwid, timestamp.desc()),)
+
     def __init__(
         self, sessao_id: str, hwid: str, tipo: str, dados: str, lucro: float = 0.0
     ):
@@ -315,10 +502,66 @@ class LogBot(db.Model):
         }
 
 
+class ContadorSistema(db.Model):
+    """
+    Contadores agregados mantidos na ingestão (ex.: lucro_total).
+
+    Evita o SUM sobre log_bot inteiro a cada leitura das estatísticas.
+    """
+
+    __tablename__ = "contador_sistema"
+
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Float, default=0.0, nullable=False)
+
+
+@dataclass(frozen=True)
+class LicencaResumo:
+    """
+    Cópia leve de Licenca para o cache de /validar.
+
+    Não carrega sessão do SQLAlchemy, então pode ser serializada no cache e
+    lida depois do fim da requisição sem virar instância "detached".
+    """
+
+    id: int
+    chave: str
+    ativa: bool
+    data_expiracao: Optional[datetime]
+    hwid: Optional[str]
+    cliente_nome: Optional[str]
+    plano_tipo: Optional[str]
+
+    # Mesmas regras de expiração do modelo (só dependem de data_expiracao)
+    esta_expirada = Licenca.esta_expirada
+    dias_restantes = Licenca.dias_restantes
+
+
 # =============================================================================
 # DECORADORES DE SEGURANÇA
 # =============================================================================
 
+# SHA-256 da última credencial admin aceita: requisições repetidas do painel
+# pulam o KDF (caro de propósito). Falhas sempre passam pelo KDF completo.
+_digest_admin_autorizado: Optional[bytes] = None
+
+
+def _credenciais_admin_validas(username: str, password: str) -> bool:
+    """Valida usuário/senha admin, reaproveitando a última verificação bem-sucedida."""
+    global _digest_admin_autorizado
+
+    digest = hashlib.sha256(f"{username}:{password}".encode("utf-8")).digest()
+    cache = _digest_admin_autorizado
+    if cache is not None and hmac.compare_digest(digest, cache):
+        return True
+
+    valido = hmac.compare_digest(
+        username.encode("utf-8"), Config.ADMIN_USERNAME.encode("utf-8")
+    ) and check_password_hash(Config.get_admin_password_hash(), password)
+    if valido:
+        _digest_admin_autorizado = digest
+    return valido
+
 
 def require_admin_auth(f):
     """
@@ -342,16 +585,11 @@ def require_admin_auth(f):
             )
 
         # Valida credenciais
-        username_valido = auth.username == Config.ADMIN_USERNAME
-        senha_valida = check_password_hash(
-            Config.ADMIN_PASSWORD_HASH, auth.password or ""
-        )
-
-        if not (username_valido and senha_valida):
-            logger.warning(f"❌ Tentativa de acesso admin falhou: {auth.username}")
+        if not _credenciais_admin_validas(auth.username or "", auth.password or ""):
+            logger.warning("❌ Tentativa de acesso admin falhou: %s", auth.username)
             return jsonify({"erro": "Credenciais inválidas"}), 403
 
-        logger.info(f"✅ Acesso admin autorizado: {auth.username}")
+        logger.info("✅ Acesso admin autorizado: %s", auth.username)
         return f(*args, **kwargs)
 
     return decorated_function
@@ -367,6 +605,9 @@ def validar_json_obrigatorio(campos_obrigatorios: list):
             ...
     """
 
+    # Lista congelada uma vez, na decoração da rota
+    campos = tuple(campos_obrigatorios)
+
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
@@ -374,28 +615,27 @@ def validar_json_obrigatorio(campos_obrigatorios: list):
                 return jsonify({"erro": "Content-Type deve ser application/json"}), 400
 
             dados = request.get_json(silent=True)
-            if not dados:
+            if not dados or not isinstance(dados, dict):
                 return jsonify({"erro": "JSON inválido ou vazio"}), 400
 
-            # Verifica campos obrigatórios
-            campos_faltantes = [
-                campo
-                for campo in campos_obrigatorios
-                if campo not in dados or not dados[campo]
-            ]
-
-            if campos_faltantes:
-                return (
-                    jsonify(
-                        {
-                            "erro": "Campos obrigatórios ausentes",
-                            "campos_faltantes": campos_faltantes,
-                        }
-                    ),
-                    400,
-                )
+            # Corpo já decodificado fica em g: a view não decodifica de novo
+            g.json_body = dados
 
-            return f(*args, **kwargs)
+            # Caminho comum (tudo presente): nenhuma lista é montada
+            if all(dados.get(campo) for campo in campos):
+                return f(*args, **kwargs)
+
+            # Algum campo falta: monta a lista só para a mensagem de erro
+            campos_faltantes = [campo for campo in campos if not dados.get(campo)]
+            return (
+                jsonify(
+                    {
+                        "erro": "Campos obrigatórios ausentes",
+                        "campos_faltantes": campos_faltantes,
+                    }
+                ),
+                400,
+            )
 
         return decorated_function
 
@@ -407,9 +647,105 @@ def validar_json_obrigatorio(campos_obrigatorios: list):
 # =============================================================================
 
 
+@cache.memoize(timeout=Config.CACHE_LICENCA_TIMEOUT)
+def buscar_licenca_por_chave(chave: str) -> Optional[LicencaResumo]:
+    """
+    Busca a licença pela chave, com cache (o bot valida a cada poucos segundos).
+
+    Chave inexistente retorna None e não é cacheada. Toda escrita em uma
+    licença deve chamar invalidar_cache_licenca().
+    """
+    licenca = Licenca.query.filter_by(chave=chave).first()
+    if not licenca:
+        return None
+
+    return LicencaResumo(
+        id=licenca.id,
+        chave=licenca.chave,
+        ativa=licenca.ativa,
+        data_expiracao=licenca.data_expiracao,
+        hwid=licenca.hwid,
+        cliente_nome=licenca.cliente_nome,
+        plano_tipo=licenca.plano_tipo,
+    )
+
+
+# L1 por processo (TTLCache não é thread-safe: acesso sob lock). Com
+# SimpleCache o cache principal já é local, então o L1 fica desligado
+_cache_licenca_local: Optional[TTLCache] = (
+    TTLCache(
+        maxsize=Config.CACHE_LICENCA_LOCAL_MAX, ttl=Config.CACHE_LICENCA_LOCAL_TIMEOUT
+    )
+    if Config.CACHE_TYPE != "SimpleCache" and Config.CACHE_LICENCA_LOCAL_TIMEOUT > 0
+    else None
+)
+_cache_licenca_local_lock = threading.Lock()
+
+
+def obter_licenca(chave: str) -> Optional[LicencaResumo]:
+    """Licença para /validar: L1 em memória, depois o cache compartilhado/banco."""
+    if _cache_licenca_local is None:
+        return buscar_licenca_por_chave(chave)
+
+    with _cache_licenca_local_lock:
+        licenca = _cache_licenca_local.get(chave)
+    if licenca is not None:
+        return licenca
+
+    licenca = buscar_licenca_por_chave(chave)
+    if licenca is not None:
+        with _cache_licenca_local_lock:
+            _cache_licenca_local[chave] = licenca
+    return licenca
+
+
+def invalidar_cache_licenca(chave: str) -> None:
+    """Descarta a licença do cache de validação após um commit."""
+    cache.delete_memoized(buscar_licenca_por_chave, chave)
+    if _cache_licenca_local is not None:
+        with _cache_licenca_local_lock:
+            _cache_licenca_local.pop(chave, None)
+
+
 def gerar_chave_licenca() -> str:
-    """Gera uma chave de licença única."""
-    return f"KEY-{str(uuid.uuid4()).upper()[:14]}"
+    """Gera uma chave de licença única (KEY- + 14 hex, 56 bits do os.urandom)."""
+    return f"KEY-{secrets.token_hex(7).upper()}"
+
+
+# Envio de email fora da requisição: o webhook responde ao Mercado Pago sem
+# esperar a negociação SMTP (evita timeouts e reenvios do webhook)
+_pool_emails = ThreadPoolExecutor(max_workers=2, thread_name_prefix="email")
+
+# Espera (segundos) antes de cada tentativa de envio
+EMAIL_ESPERAS_TENTATIVAS = (0, 10, 60)
+
+
+def _enviar_email_com_retentativas(
+    email: str, nome: str, chave: str, link_download: str
+) -> bool:
+    """Envia o email da licença, tentando de novo se o SMTP falhar."""
+    for tentativa, espera in enumerate(EMAIL_ESPERAS_TENTATIVAS, start=1):
+        time.sleep(espera)
+        try:
+            if enviar_email_licenca(email, nome, chave, link_download):
+                logger.info(f"📧 Email enviado para {email}")
+                return True
+        except Exception as e:
+            logger.error(f"❌ Erro ao enviar email (tentativa {tentativa}): {e}")
+
+    logger.warning(f"⚠️ Falha ao enviar email para {email}")
+    return False
+
+
+def agendar_email_licenca(email: str, nome: str, chave: str) -> bool:
+    """Agenda o email da licença em segundo plano. Retorna se foi agendado."""
+    if not email:
+        return False
+
+    _pool_emails.submit(
+        _enviar_email_com_retentativas, email, nome, chave, Config.LINK_DOWNLOAD_BOT
+    )
+    return True
 
 
 def obter_info_plano(plano: str) -> dict:
@@ -522,20 +858,23 @@ def validar_licenca():
         403: { "status": "erro", "mensagem": "..." }
         404: { "status": "erro", "mensagem": "Licença não encontrada" }
     """
-    dados = request.get_json()
+    dados = g.json_body
     chave = dados.get("chave", "").strip()
     hwid = dados.get("hwid", "").strip()
 
-    # Busca licença
-    licenca = Licenca.query.filter_by(chave=chave).first()
+    # Busca licença (L1 local + cache; sem ida ao banco na maioria das validações)
+    licenca = obter_licenca(chave)
+
+    # Relógio lido uma vez só para todas as verificações de data
+    agora = datetime.now(timezone.utc)
 
     if not licenca:
-        logger.warning(f"❌ Tentativa de validação com chave inválida: {chave}")
+        logger.warning("❌ Tentativa de validação com chave inválida: %s", chave)
         return jsonify({"status": "erro", "mensagem": "Licença não encontrada"}), 404
 
     # Verifica se está ativa
     if not licenca.ativa:
-        logger.warning(f"❌ Tentativa de usar licença bloqueada: {chave}")
+        logger.warning("❌ Tentativa de usar licença bloqueada: %s", chave)
         return (
             jsonify(
                 {"status": "erro", "mensagem": "Licença bloqueada pelo administrador"}
@@ -544,8 +883,8 @@ def validar_licenca():
         )
 
     # Verifica expiração
-    if licenca.esta_expirada():
-        logger.warning(f"❌ Tentativa de usar licença expirada: {chave}")
+    if licenca.esta_expirada(agora):
+        logger.warning("❌ Tentativa de usar licença expirada: %s", chave)
         return (
             jsonify(
                 {
@@ -556,33 +895,49 @@ def validar_licenca():
             403,
         )
 
+    # Dados de resposta montados uma vez (iguais na ativação e na validação)
+    dados_licenca = {
+        "cliente_nome": licenca.cliente_nome,
+        "plano": licenca.plano_tipo,
+        "dias_restantes": licenca.dias_restantes(agora),
+        "expira_em": (
+            licenca.data_expiracao.strftime("%d/%m/%Y %H:%M")
+            if licenca.data_expiracao
+            else "Sem expiração"
+        ),
+    }
+
+    hwid_vinculado = licenca.hwid
+
     # Vinculação de HWID (primeira utilização)
-    if not licenca.hwid:
-        licenca.hwid = hwid
+    if not hwid_vinculado:
+        # Só vincula se ainda estiver livre no banco: o cache deste worker pode
+        # estar velho e a licença já ter sido ativada em outra máquina
+        vinculadas = Licenca.query.filter_by(id=licenca.id, hwid=None).update(
+            {"hwid": hwid}
+        )
         db.session.commit()
+        invalidar_cache_licenca(chave)
 
-        logger.info(f"✅ Licença ativada: {chave} → HWID: {hwid}")
-        return jsonify(
-            {
-                "status": "sucesso",
-                "mensagem": "Licença ativada com sucesso!",
-                "dados_licenca": {
-                    "cliente_nome": licenca.cliente_nome,
-                    "plano": licenca.plano_tipo,
-                    "dias_restantes": licenca.dias_restantes(),
-                    "expira_em": (
-                        licenca.data_expiracao.strftime("%d/%m/%Y %H:%M")
-                        if licenca.data_expiracao
-                        else "Sem expiração"
-                    ),
-                },
-            }
-        )
+        if vinculadas:
+            logger.info("✅ Licença ativada: %s → HWID: %s", chave, hwid)
+            return jsonify(
+                {
+                    "status": "sucesso",
+                    "mensagem": "Licença ativada com sucesso!",
+                    "dados_licenca": dados_licenca,
+                }
+            )
+
+        # Outra requisição vinculou antes: vale o HWID que está no banco
+        hwid_vinculado = db.session.execute(
+            select(Licenca.hwid).where(Licenca.id == licenca.id)
+        ).scalar()
 
     # Valida HWID correspondente
-    if licenca.hwid != hwid:
+    if hwid_vinculado != hwid:
         logger.warning(
-            f"❌ HWID incorreto para {chave}. Esperado: {licenca.hwid}, Recebido: {hwid}"
+            f"❌ HWID incorreto para {chave}. Esperado: {hwid_vinculado}, Recebido: {hwid}"
         )
         return (
             jsonify(
@@ -595,21 +950,12 @@ def validar_licenca():
         )
 
     # Sucesso - HWID correto
-    logger.info(f"✅ Validação OK: {chave}")
+    logger.info("✅ Validação OK: %s", chave)
     return jsonify(
         {
             "status": "sucesso",
             "mensagem": "Licença válida",
-            "dados_licenca": {
-                "cliente_nome": licenca.cliente_nome,
-                "plano": licenca.plano_tipo,
-                "dias_restantes": licenca.dias_restantes(),
-                "expira_em": (
-                    licenca.data_expiracao.strftime("%d/%m/%Y %H:%M")
-                    if licenca.data_expiracao
-                    else "Sem expiração"
-                ),
-            },
+            "dados_licenca": dados_licenca,
         }
     )
 
@@ -618,6 +964,340 @@ def validar_licenca():
 # ROTAS - TELEMETRIA (LOGS DO BOT)
 # =============================================================================
 
+# Fila dos logs recebidos; uma thread grava tudo num único INSERT em lote, em
+# vez de uma transação (e um fsync) por requisição. Fica numa lista do Redis
+# quando configurado, senão em memória no próprio worker
+_fila_logs: deque = deque()
+_fila_logs_lock = threading.Lock()
+_fila_logs_cheia = threading.Event()
+_thread_flush_logs: Optional[threading.Thread] = None
+
+# from_url não conecta agora: a conexão só abre no primeiro comando
+_redis_logs: Optional[redis.Redis] = (
+    redis.Redis.from_url(Config.TELEMETRIA_REDIS_URL)
+    if Config.TELEMETRIA_REDIS_URL
+    else None
+)
+
+
+def enfileirar_log(registro: dict) -> None:
+    """Coloca um log na fila de gravação (sobe a thread de flush no 1º uso)."""
+    global _thread_flush_logs
+
+    tamanho = 0
+    no_redis = False
+    if _redis_logs is not None:
+        try:
+            tamanho = _redis_logs.rpush(
+                Config.TELEMETRIA_REDIS_CHAVE, orjson.dumps(registro)
+            )
+            no_redis = True
+        except redis.RedisError as e:
+            # Redis fora do ar não derruba a ingestão: cai para a fila local
+            logger.warning("⚠️ Redis indisponível para telemetria: %s", e)
+
+    with _fila_logs_lock:
+        if not no_redis:
+            _fila_logs.append(registro)
+            tamanho = len(_fila_logs)
+
+        # Sobe só no primeiro log, já dentro do worker (não no master do gunicorn)
+        if _thread_flush_logs is None:
+            _thread_flush_logs = threading.Thread(
+                target=_loop_flush_logs, name="flush-telemetria", daemon=True
+            )
+            _thread_flush_logs.start()
+
+    if tamanho >= Config.TELEMETRIA_LOTE_MAX:
+        _fila_logs_cheia.set()
+
+
+def _retirar_lote_redis() -> list:
+    """Tira até TELEMETRIA_LOTE_MAX logs da lista do Redis (LRANGE+LTRIM atômico)."""
+    if _redis_logs is None:
+        return []
+
+    limite = Config.TELEMETRIA_LOTE_MAX
+    try:
+        pipe = _redis_logs.pipeline(transaction=True)
+        pipe.lrange(Config.TELEMETRIA_REDIS_CHAVE, 0, limite - 1)
+        pipe.ltrim(Config.TELEMETRIA_REDIS_CHAVE, limite, -1)
+        brutos, _ = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning("⚠️ Falha ao ler fila de telemetria no Redis: %s", e)
+        return []
+
+    return brutos
+
+
+# Idempotency-Key já vistos quando não há Redis (por worker, só um reforço)
+_logs_vistos = TTLCache(maxsize=50000, ttl=Config.TELEMETRIA_IDEMPOTENCIA_SEGUNDOS)
+_logs_vistos_lock = threading.Lock()
+
+
+def log_ja_recebido(chave_idempotencia: str) -> bool:
+    """
+    Marca a chave como vista e diz se ela já tinha chegado na janela.
+
+    Com Redis é um único SET NX EX (vale para todos os workers).
+    """
+    if _redis_logs is not None:
+        try:
+            marcado = _redis_logs.set(
+                f"{Config.TELEMETRIA_REDIS_CHAVE}:visto:{chave_idempotencia}",
+                1,
+                nx=True,
+                ex=Config.TELEMETRIA_IDEMPOTENCIA_SEGUNDOS,
+            )
+            return not marcado
+        except redis.RedisError:
+            pass
+
+    with _logs_vistos_lock:
+        if chave_idempotencia in _logs_vistos:
+            return True
+        _logs_vistos[chave_idempotencia] = True
+    return False
+
+
+# Logs recusados pelo banco quando não há Redis (dead-letter local, limitada)
+_logs_mortos: deque = deque(maxlen=1000)
+_falhas_lote_seguidas = 0
+
+
+def esquecer_log_recebido(chave_idempotencia: str) -> None:
+    """Desfaz log_ja_recebido quando o log não chegou a entrar na fila."""
+    if _redis_logs is not None:
+        try:
+            _redis_logs.delete(
+                f"{Config.TELEMETRIA_REDIS_CHAVE}:visto:{chave_idempotencia}"
+            )
+        except redis.RedisError:
+            pass
+
+    with _logs_vistos_lock:
+        _logs_vistos.pop(chave_idempotencia, None)
+
+
+def _inserir_lucro_total_semeado():
+    """
+    INSERT do contador lucro_total com o SUM atual de log_bot, já com o
+    ON CONFLICT do dialeto em uso (PostgreSQL em produção, SQLite local).
+    """
+    insert_dialeto = (
+        pg_insert if db.engine.dialect.name == "postgresql" else sqlite_insert
+    )
+    # WHERE true: no SQLite, INSERT ... SELECT ... ON CONFLICT exige um WHERE
+    soma = select(
+        literal("lucro_total"), func.coalesce(func.sum(LogBot.lucro), 0.0)
+    ).where(true())
+    return insert_dialeto(ContadorSistema).from_select(["nome", "valor"], soma)
+
+
+def _semear_lucro_total() -> None:
+    """Cria o contador lucro_total se ainda não existe (um INSERT atômico)."""
+    db.session.execute(
+        _inserir_lucro_total_semeado().on_conflict_do_nothing(index_elements=["nome"])
+    )
+    db.session.commit()
+
+
+def _somar_lucro_total(delta: float) -> None:
+    """Soma delta ao contador, na transação do lote (cria o contador se faltar)."""
+    atualizados = db.session.execute(
+        update(ContadorSistema)
+        .where(ContadorSistema.nome == "lucro_total")
+        .values(valor=ContadorSistema.valor + delta)
+    ).rowcount
+    if atualizados:
+        return
+
+    # Sem contador: semeia com o SUM (que já inclui os logs deste lote). Se
+    # outro worker semear ao mesmo tempo, o conflito espera o commit dele e
+    # só soma o delta, sem perder nem contar o lote duas vezes
+    db.session.execute(
+        _inserir_lucro_total_semeado().on_conflict_do_update(
+            index_elements=["nome"],
+            set_={"valor": ContadorSistema.valor + delta},
+        )
+    )
+
+
+def _gravar_logs(registros: list) -> None:
+    """INSERT em lote e contador de lucro num único commit (levanta se falhar)."""
+    db.session.execute(insert(LogBot), registros)
+    # Mesmo commit do lote: o contador nunca diverge dos logs gravados
+    delta = sum(registro["lucro"] for registro in registros)
+    if delta:
+        _somar_lucro_total(delta)
+    db.session.commit()
+
+
+def _devolver_a_fila(itens: list) -> None:
+    """
+    Põe de volta na frente da fila os logs que não foram gravados, na ordem.
+
+    Cada item é (registro, bruto): bruto é o JSON que veio do Redis, ou None
+    para o que veio da fila local. Sem Redis tudo fica na fila local.
+    """
+    brutos = [bruto for _, bruto in itens if bruto is not None]
+    if brutos:
+        try:
+            _redis_logs.lpush(Config.TELEMETRIA_REDIS_CHAVE, *reversed(brutos))
+            itens = [item for item in itens if item[1] is None]
+        except redis.RedisError as e:
+            logger.warning("⚠️ Lote de telemetria mantido na fila local: %s", e)
+
+    with _fila_logs_lock:
+        _fila_logs.extendleft(registro for registro, _ in reversed(itens))
+
+
+def _descartar_log(item: tuple, erro: Exception) -> None:
+    """Tira da fila um log que o banco recusa, guardando-o na dead-letter."""
+    registro, bruto = item
+    logger.error("❌ Log de telemetria recusado (%s): %r", erro, registro or bruto)
+
+    if _redis_logs is not None:
+        try:
+            _redis_logs.rpush(
+                f"{Config.TELEMETRIA_REDIS_CHAVE}:mortos",
+                bruto if bruto is not None else orjson.dumps(registro),
+            )
+            return
+        except redis.RedisError:
+            pass
+    _logs_mortos.append(registro if registro is not None else bruto)
+
+
+def _gravar_logs_um_a_um(itens: list) -> int:
+    """
+    Grava log a log depois de o lote falhar várias vezes seguidas.
+
+    Log recusado vai para a dead-letter. Se o problema é o próprio banco
+    (OperationalError: conexão, timeout) o restante volta para a fila.
+    """
+    global _falhas_lote_seguidas
+
+    gravados = 0
+    for indice, item in enumerate(itens):
+        try:
+            _gravar_logs([item[0]])
+        except OperationalError as e:
+            db.session.rollback()
+            logger.error(f"❌ Banco indisponível para telemetria: {e}")
+            _devolver_a_fila(itens[indice:])
+            return gravados
+        except Exception as e:
+            db.session.rollback()
+            _descartar_log(item, e)
+        else:
+            gravados += 1
+
+    _falhas_lote_seguidas = 0
+    return gravados
+
+
+def descarregar_logs() -> int:
+    """Grava no banco todos os logs pendentes. Retorna quantos foram gravados."""
+    global _falhas_lote_seguidas
+
+    with _fila_logs_lock:
+        itens = [(registro, None) for registro in _fila_logs]
+        _fila_logs.clear()
+
+    for bruto in _retirar_lote_redis():
+        try:
+            registro = orjson.loads(bruto)
+            registro["timestamp"] = datetime.fromisoformat(registro["timestamp"])
+        except (ValueError, KeyError, TypeError) as e:
+            _descartar_log((None, bruto), e)
+            continue
+        itens.append((registro, bruto))
+
+    if not itens:
+        return 0
+
+    with app.app_context():
+        try:
+            _gravar_logs([registro for registro, _ in itens])
+        except Exception as e:
+            db.session.rollback()
+            _falhas_lote_seguidas += 1
+            logger.error(f"❌ Erro ao gravar lote de {len(itens)} logs: {e}")
+
+            if _falhas_lote_seguidas < Config.TELEMETRIA_TENTATIVAS_LOTE:
+                # Pode ser passageiro: o lote volta inteiro para o próximo ciclo
+                _devolver_a_fila(itens)
+                return 0
+            return _gravar_logs_um_a_um(itens)
+
+    _falhas_lote_seguidas = 0
+    logger.debug("📊 Lote de telemetria gravado: %d logs", len(itens))
+    return len(itens)
+
+
+def podar_logs_antigos() -> int:
+    """
+    Apaga logs mais velhos que TELEMETRIA_RETENCAO_DIAS. Retorna quantos apagou.
+
+    Em lotes por id (cada lote é uma transação curta), para não segurar lock
+    nem inchar o WAL. O contador lucro_total não muda: continua histórico.
+    """
+    if Config.TELEMETRIA_RETENCAO_DIAS <= 0:
+        return 0
+
+    corte = datetime.now(timezone.utc) - timedelta(days=Config.TELEMETRIA_RETENCAO_DIAS)
+    apagados = 0
+
+    with app.app_context():
+        while True:
+            ids_lote = (
+                select(LogBot.id)
+                .where(LogBot.timestamp < corte)
+                .limit(Config.TELEMETRIA_PODA_LOTE)
+            )
+            try:
+                resultado = db.session.execute(
+                    delete(LogBot).where(LogBot.id.in_(ids_lote))
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"❌ Erro ao podar logs antigos: {e}")
+                break
+
+            apagados += resultado.rowcount
+            if resultado.rowcount < Config.TELEMETRIA_PODA_LOTE:
+                break
+
+    if apagados:
+        logger.info("🧹 Logs de telemetria podados: %d", apagados)
+    return apagados
+
+
+def _loop_flush_logs():
+    """Thread de fundo: descarrega a fila a cada intervalo ou quando enche."""
+    proxima_poda = time.monotonic()
+    while True:
+        _fila_logs_cheia.wait(Config.TELEMETRIA_FLUSH_SEGUNDOS)
+        _fila_logs_cheia.clear()
+        descarregar_logs()
+
+        if time.monotonic() >= proxima_poda:
+            podar_logs_antigos()
+            proxima_poda = time.monotonic() + Config.TELEMETRIA_PODA_INTERVALO
+
+
+# Não perde o que ainda está na fila quando o processo encerra
+atexit.register(descarregar_logs)
+
+
+def _campo_texto_log(valor, padrao: str, limite: int) -> str:
+    """Campo texto do log já no formato da coluna (None vira padrão, corta no limite)."""
+    if valor is None or valor == "":
+        return padrao
+    return str(valor)[:limite]
+
 
 @app.route("/telemetria/log", methods=["POST"])
 @limiter.limit("100 per minute")
@@ -634,33 +1314,60 @@ def receber_log():
             "lucro": 10.50
         }
 
+    Header opcional Idempotency-Key: um reenvio do mesmo log (retry do
+    cliente) dentro da janela é descartado sem gravar de novo.
+
     Response:
-        200: { "status": "ok" }
+        204: sem corpo (log aceito ou reenvio descartado)
         400: { "status": "erro", "mensagem": "..." }
     """
     try:
         dados = request.get_json(silent=True)
 
-        if not dados:
+        if not dados or not isinstance(dados, dict):
             return jsonify({"status": "erro", "mensagem": "JSON inválido"}), 400
 
-        # Campos com valores padrão
-        novo_log = LogBot(
-            sessao_id=dados.get("sessao_id", "unknown"),
-            hwid=dados.get("hwid", "unknown"),
-            tipo=dados.get("tipo", "info"),
-            dados=dados.get("dados", ""),
-            lucro=float(dados.get("lucro", 0.0)),
-        )
+        # O bot manda "dados" como objeto: vira texto aqui (coluna Text)
+        detalhes = dados.get("dados")
+        if detalhes is not None and not isinstance(detalhes, str):
+            detalhes = orjson.dumps(detalhes).decode()
+
+        # Campos normalizados para as colunas (dict simples, não instância do
+        # ORM): um log malformado falha aqui, na própria requisição, e não no
+        # INSERT do lote junto com os logs válidos
+        novo_log = {
+            "sessao_id": _campo_texto_log(dados.get("sessao_id"), "unknown", 100),
+            "hwid": _campo_texto_log(dados.get("hwid"), "unknown", 100),
+            "tipo": _campo_texto_log(dados.get("tipo"), "info", 50),
+            "dados": detalhes or "",
+            "lucro": float(dados.get("lucro") or 0.0),
+            # Hora do recebimento, não a do flush
+            "timestamp": datetime.now(timezone.utc),
+        }
 
-        db.session.add(novo_log)
-        db.session.commit()
+        # Só deduplica com chave explícita: dois logs iguais sem chave podem
+        # ser eventos legítimos distintos (o bot não manda id nem horário).
+        # A chave é marcada só depois da validação e desfeita se o log não
+        # entrar na fila: o retry de uma requisição que falhou não é descartado
+        chave_idempotencia = request.headers.get("Idempotency-Key")
+        if chave_idempotencia and log_ja_recebido(chave_idempotencia):
+            return "", 204
 
-        logger.debug(f"📊 Log recebido: {novo_log.tipo} | HWID: {novo_log.hwid}")
+        try:
+            enfileirar_log(novo_log)
+        except Exception:
+            if chave_idempotencia:
+                esquecer_log_recebido(chave_idempotencia)
+            raise
 
-        return jsonify({"status": "ok"})
+        logger.debug(
+            "📊 Log recebido: %s | HWID: %s", novo_log["tipo"], novo_log["hwid"]
+        )
 
-    except ValueError as e:
+        # Endpoint de maior volume: sem corpo, nada a serializar
+        return "", 204
+
+    except (ValueError, TypeError) as e:
         logger.error(f"❌ Erro ao processar log: {e}")
         return jsonify({"status": "erro", "mensagem": "Valor de lucro inválido"}), 400
 
@@ -683,35 +1390,23 @@ def receber_log():
 @validar_json_obrigatorio(["email", "nome", "plano"])
 def criar_pagamento():
     try:
-        dados = request.get_json()
+        dados = g.json_body
         email = dados.get("email")
         nome = dados.get("nome", "Cliente")
         whatsapp = dados.get("whatsapp", "")
         # Recebe o Telegram (se o site mandar)
         telegram = dados.get("telegram_chat_id", "")
-        plano = dados.get("plano", "mensal")
-
-        # --- TABELA DE PREÇOS ATUALIZADA ---
-        if plano == "experimental":
-            preco = 4.99
-            titulo = "CrashBot Experimental (7 Dias)"
-        elif plano == "semanal":
-            preco = 149.00
-            titulo = "CrashBot VIP Semanal (7 Dias)"
-        elif plano == "mensal":
-            preco = 499.00
-            titulo = "CrashBot PRO Mensal (30 Dias)"
-        else:
-            preco = 499.00
-            titulo = "CrashBot Premium"
+        # Chave já normalizada: é ela que volta no metadata para o webhook
+        plano = str(dados.get("plano", "mensal")).lower().strip()
 
-        token_mp = Config.MP_ACCESS_TOKEN
+        # --- TABELA DE PREÇOS (Config.PRECOS_PLANOS, fonte única) ---
+        info_plano = obter_info_plano(plano)
+        preco = info_plano["preco"]
+        titulo = info_plano["titulo"]
 
-        if not token_mp:
+        if MP_SDK is None:
             return jsonify({"erro": "Token MP ausente"}), 500
 
-        sdk = mercadopago.SDK(token_mp)
-
         preference_data = {
             "items": [
                 {
@@ -739,7 +1434,7 @@ def criar_pagamento():
             "notification_url": f"{Config.BASE_URL or ''}/webhook/mercadopago",
         }
 
-        result = sdk.preference().create(preference_data)
+        result = MP_SDK.preference().create(preference_data)
 
         # Verifica se o MP respondeu corretamente
         if "response" not in result or "init_point" not in result["response"]:
@@ -757,9 +1452,22 @@ def criar_pagamento():
 # =============================================================================
 # ROTAS - WEBHOOK (PROCESSAMENTO DE VENDAS)
 # =============================================================================
-def _calcular_dias_plano(plano: str, descricao: str) -> int:
-    """Helper para determinar dias de validade baseado no plano."""
-    return 7 if plano in {"experimental", "semanal"} else 30
+def _travar_pagamento(payment_id: str) -> bool:
+    """
+    Tenta o advisory lock do PostgreSQL para este pagamento (sem esperar).
+
+    Retorna False se outro worker já está processando o mesmo payment_id.
+    Em outros bancos (SQLite de desenvolvimento) sempre retorna True.
+    """
+    if db.engine.dialect.name != "postgresql":
+        return True
+
+    return bool(
+        db.session.execute(
+            text("SELECT pg_try_advisory_xact_lock(hashtext(:pid))"),
+            {"pid": payment_id},
+        ).scalar()
+    )
 
 
 @app.route("/webhook/mercadopago", methods=["POST"])
@@ -771,14 +1479,18 @@ def webhook_mercadopago():
     if not pid:
         return jsonify({"status": "ignored"}), 200
 
-    token_mp = Config.MP_ACCESS_TOKEN
-
-    if not token_mp:
+    if MP_SDK is None:
         return jsonify({"error": "config_missing"}), 500
 
+    # Retries concorrentes do MP para o mesmo pagamento: só um worker processa
+    # (lock da transação, solto no commit/rollback). O outro nem consulta o MP
+    # e responde 409 para o MP tentar de novo depois
+    if not _travar_pagamento(str(pid)):
+        return jsonify({"status": "in_progress"}), 409
+
     try:
         # 2. Consulta ao Mercado Pago
-        payment_info = mercadopago.SDK(token_mp).payment().get(pid)
+        payment_info = MP_SDK.payment().get(pid)
 
         if payment_info["status"] != 200:
             return jsonify({"error": "mp_api_error"}), payment_info["status"]
@@ -789,21 +1501,17 @@ def webhook_mercadopago():
         if resp.get("status") != "approved":
             return jsonify({"status": "ignored", "reason": "not_approved"}), 200
 
-        # 3. Verificação de Idempotência (Evita duplicidade)
-        if Licenca.query.filter_by(payment_id=str(pid)).first():
-            return jsonify({"status": "ok", "msg": "already_processed"}), 200
-
-        # 4. Extração de Dados
+        # 3. Extração de Dados
         meta = resp.get("metadata", {})
         payer = resp.get("payer", {})
 
         nome = meta.get("nome_real") or payer.get("first_name", "Cliente")
         email = payer.get("email")
-        plano = meta.get("plano_escolhido")
+        plano = (meta.get("plano_escolhido") or "mensal").lower().strip()
 
-        # 5. Criação da Licença
-        dias = _calcular_dias_plano(plano, resp.get("description", ""))
-        chave = f"KEY-{str(uuid.uuid4()).upper()[:14]}"
+        # 4. Criação da Licença (mesma tabela de planos do checkout)
+        dias = obter_info_plano(plano)["dias"]
+        chave = gerar_chave_licenca()
 
         licenca = Licenca(
             chave=chave,
@@ -816,11 +1524,17 @@ def webhook_mercadopago():
             dias_validade=dias,
         )
 
+        # 5. Idempotência atômica: payment_id é UNIQUE, então um retry
+        # concorrente do MP falha no INSERT em vez de duplicar a licença
         db.session.add(licenca)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({"status": "ok", "msg": "already_processed"}), 200
 
         # 6. Finalização
-        enviar_email_licenca(email, nome, chave, Config.LINK_DOWNLOAD_BOT)
+        agendar_email_licenca(email, nome, chave)
         logger.info(f"✅ Venda Webhook Completa: {nome} | Plano: {plano}")
 
         return jsonify({"status": "created"}), 201
@@ -880,23 +1594,8 @@ def _processar_venda_aprovada(
 
         logger.info(f"✅ Licença criada: {chave} | Cliente: {nome} | Plano: {plano}")
 
-        # 5. Enviar email com licença
-        email_enviado = False
-        if email:
-            try:
-                email_enviado = enviar_email_licenca(
-                    email_cliente=email,
-                    nome_cliente=nome,
-                    chave_licenca=chave,
-                    link_download=Config.LINK_DOWNLOAD_BOT,
-                )
-
-                if email_enviado:
-                    logger.info(f"📧 Email enviado para {email}")
-                else:
-                    logger.warning(f"⚠️ Falha ao enviar email para {email}")
-            except Exception as e:
-                logger.error(f"❌ Erro ao enviar email: {e}")
+        # 5. Enviar email com licença (em segundo plano)
+        email_agendado = agendar_email_licenca(email, nome, chave)
 
         # 6. Retornar sucesso
         return (
@@ -908,7 +1607,7 @@ def _processar_venda_aprovada(
                         "cliente": nome,
                         "plano": plano,
                         "dias_validade": dias_validade,
-                        "email_enviado": email_enviado,
+                        "email_agendado": email_agendado,
                     },
                 }
             ),
@@ -924,21 +1623,36 @@ def _processar_venda_aprovada(
 # =============================================================================
 # ROTAS ADMINISTRATIVAS (PROTEGIDAS)
 # =============================================================================
-@app.route("/admin/reset_database", methods=["GET"])
+@app.route("/admin/reset_database", methods=["POST"])
 # @require_admin_auth  <--- COMENTAMOS ESSA LINHA PARA LIBERAR O ACESSO
 def reset_database():
     """
     ⚠️ PERIGOSO: Recria todas as tabelas do banco.
-    Requer confirmação via query param: ?confirmar=sim
+    Requer POST com corpo JSON: {"confirmar": "sim"}
+
+    Não aceita GET: prefetch de navegador ou scanner de links não pode
+    derrubar o banco só por visitar a URL. Exige também o header
+    X-Admin-Token igual a ADMIN_RESET_TOKEN (rota desligada se não houver).
     """
-    confirmacao = request.args.get("confirmar", "").lower()
+    if not Config.ADMIN_RESET_TOKEN:
+        abort(404)
+
+    token = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(
+        token.encode("utf-8"), Config.ADMIN_RESET_TOKEN.encode("utf-8")
+    ):
+        logger.warning("❌ Reset do banco negado: token inválido")
+        return jsonify({"erro": "Token inválido"}), 401
+
+    dados = request.get_json(silent=True) or {}
+    confirmacao = str(dados.get("confirmar", "")).lower()
 
     if confirmacao != "sim":
         return (
             jsonify(
                 {
                     "erro": "Confirmação necessária",
-                    "instrucoes": "Adicione ?confirmar=sim na URL para confirmar.",
+                    "instrucoes": 'Envie POST com o JSON {"confirmar": "sim"}.',
                 }
             ),
             400,
@@ -949,13 +1663,16 @@ def reset_database():
 
         db.drop_all()  # Apaga o velho
         db.create_all()  # Cria o novo
+        db.session.remove()
+        db.engine.dispose()  # Pool novo, sem conexões presas às tabelas antigas
+        cache.clear()  # Licenças cacheadas não existem mais
 
         logger.warning("✅ Banco resetado com sucesso")
 
         return jsonify(
             {
                 "status": "sucesso",
-                "mensagem": "Banco de dados resetado (MODO SEM SENHA). Tabelas recriadas.",
+                "mensagem": "Banco de dados resetado. Tabelas recriadas.",
                 "tabelas_agora_no_banco": list(db.metadata.tables.keys()),
             }
         )
@@ -973,79 +1690,137 @@ def detalhes_licenca(licenca_id: int):
     return jsonify(licenca.to_dict())
 
 
+def _definir_status_licenca(licenca_id: int, ativa: bool) -> str:
+    """
+    Ativa/desativa a licença num único UPDATE ... RETURNING (uma ida ao banco).
+
+    Returns:
+        A chave da licença alterada (404 se o id não existir).
+    """
+    stmt = (
+        update(Licenca)
+        .where(Licenca.id == licenca_id)
+        .values(ativa=ativa)
+        .returning(Licenca.chave)
+    )
+    chave = db.session.execute(stmt).scalar_one_or_none()
+    if chave is None:
+        db.session.rollback()
+        abort(404)
+
+    db.session.commit()
+    invalidar_cache_licenca(chave)
+    invalidar_cache_estatisticas()
+    return chave
+
+
 @app.route("/admin/licenca/<int:licenca_id>/bloquear", methods=["POST"])
 @require_admin_auth
 def bloquear_licenca(licenca_id: int):
     """Bloqueia (desativa) uma licença."""
-    licenca = Licenca.query.get_or_404(licenca_id)
-    licenca.ativa = False
-    db.session.commit()
+    chave = _definir_status_licenca(licenca_id, ativa=False)
 
-    logger.info(f"🔒 Licença bloqueada: {licenca.chave}")
+    logger.info(f"🔒 Licença bloqueada: {chave}")
 
-    return jsonify(
-        {"status": "sucesso", "mensagem": f"Licença {licenca.chave} bloqueada"}
-    )
+    return jsonify({"status": "sucesso", "mensagem": f"Licença {chave} bloqueada"})
 
 
 @app.route("/admin/licenca/<int:licenca_id>/desbloquear", methods=["POST"])
 @require_admin_auth
 def desbloquear_licenca(licenca_id: int):
     """Desbloqueia (ativa) uma licença."""
-    licenca = Licenca.query.get_or_404(licenca_id)
-    licenca.ativa = True
-    db.session.commit()
+    chave = _definir_status_licenca(licenca_id, ativa=True)
 
-    logger.info(f"🔓 Licença desbloqueada: {licenca.chave}")
+    logger.info(f"🔓 Licença desbloqueada: {chave}")
 
-    return jsonify(
-        {"status": "sucesso", "mensagem": f"Licença {licenca.chave} desbloqueada"}
+    return jsonify({"status": "sucesso", "mensagem": f"Licença {chave} desbloqueada"})
+
+
+def _ler_lucro_total() -> float:
+    """
+    Lê o contador de lucro total (O(1)).
+
+    O contador é semeado na inicialização; se ainda não existe (banco
+    resetado), é semeado aqui com o mesmo INSERT ... ON CONFLICT.
+    """
+    consulta = select(ContadorSistema.valor).where(
+        ContadorSistema.nome == "lucro_total"
+    )
+    valor = db.session.execute(consulta).scalar_one_or_none()
+    if valor is None:
+        _semear_lucro_total()
+        valor = db.session.execute(consulta).scalar_one()
+    return float(valor)
+
+
+@cache.memoize(timeout=Config.CACHE_ESTATISTICAS_TIMEOUT)
+def _calcular_estatisticas() -> dict:
+    """Agrega os números do painel (cacheado: polling do admin não bate no banco)."""
+    # Uma ida ao banco: contagens por plano (somadas abaixo para os totais) e
+    # os números da telemetria como subconsultas escalares
+    total_logs_sq = select(func.count(LogBot.id)).scalar_subquery()
+    lucro_total_sq = (
+        select(ContadorSistema.valor)
+        .where(ContadorSistema.nome == "lucro_total")
+        .scalar_subquery()
     )
 
+    # --- CORREÇÃO DEFINITIVA ---
+    # Adicionamos '# type: ignore' para calar o falso positivo do Pylance
+    # O código está correto, é apenas o verificador que está confuso.
+    stmt = select(
+        Licenca.plano_tipo,  # type: ignore
+        func.count(Licenca.id),
+        func.count(Licenca.id).filter(Licenca.ativa),
+        total_logs_sq,
+        lucro_total_sq,
+    ).group_by(
+        Licenca.plano_tipo  # type: ignore
+    )
 
-@app.route("/admin/estatisticas", methods=["GET"])
-@require_admin_auth
-def estatisticas():
-    """Retorna estatísticas gerais do sistema."""
-    try:
-        # Contagens simples
-        total_licencas = Licenca.query.count()
-        licencas_ativas = Licenca.query.filter_by(ativa=True).count()
-
-        # --- CORREÇÃO DEFINITIVA ---
-        # Adicionamos '# type: ignore' para calar o falso positivo do Pylance
-        # O código está correto, é apenas o verificador que está confuso.
-        stmt = (
-            select(Licenca.plano_tipo, func.count(Licenca.id))  # type: ignore
-            .where(Licenca.ativa)
-            .group_by(Licenca.plano_tipo)  # type: ignore
-        )
+    resultados = db.session.execute(stmt).all()
 
-        resultados = db.session.execute(stmt).all()
+    total_licencas = sum(row[1] for row in resultados)
+    licencas_ativas = sum(row[2] for row in resultados)
 
-        # Converte os resultados em dicionário
-        dict_planos = {row[0]: row[1] for row in resultados if row[0]}
+    # Converte os resultados em dicionário (só planos com licenças ativas)
+    dict_planos = {row[0]: row[2] for row in resultados if row[0] and row[2]}
 
-        # Total de logs
-        total_logs = LogBot.query.count()
+    if resultados:
+        total_logs, lucro_total = resultados[0][3], resultados[0][4]
+    else:
+        # Sem licenças o GROUP BY não devolve linha nenhuma
+        total_logs = db.session.execute(select(func.count(LogBot.id))).scalar_one()
+        lucro_total = None
 
-        # Lucro total
-        lucro_total = db.session.query(func.sum(LogBot.lucro)).scalar() or 0
+    if lucro_total is None:
+        lucro_total = _ler_lucro_total()
+
+    return {
+        "licencas": {
+            "total": total_licencas,
+            "ativas": licencas_ativas,
+            "inativas": total_licencas - licencas_ativas,
+            "por_plano": dict_planos,
+        },
+        "telemetria": {
+            "total_logs": total_logs,
+            "lucro_total": float(lucro_total or 0),
+        },
+    }
+
+
+def invalidar_cache_estatisticas() -> None:
+    """Descarta as estatísticas cacheadas após mudar o status de uma licença."""
+    cache.delete_memoized(_calcular_estatisticas)
 
-        return jsonify(
-            {
-                "licencas": {
-                    "total": total_licencas,
-                    "ativas": licencas_ativas,
-                    "inativas": total_licencas - licencas_ativas,
-                    "por_plano": dict_planos,
-                },
-                "telemetria": {
-                    "total_logs": total_logs,
-                    "lucro_total": float(lucro_total),
-                },
-            }
-        )
+
+@app.route("/admin/estatisticas", methods=["GET"])
+@require_admin_auth
+def estatisticas():
+    """Retorna estatísticas gerais do sistema."""
+    try:
+        return jsonify(_calcular_estatisticas())
 
     except Exception as e:
         logger.error(f"❌ Erro ao gerar estatísticas: {e}")
@@ -1109,12 +1884,26 @@ def inicializar_app():
 
         # Criar tabelas se não existirem
         try:
+            # create_all não mexe em tabela existente: índices novos dos
+            # modelos (ex.: idx_log_bot_hwid_ts) não são criados aqui. Em banco
+            # já existente rode o CREATE INDEX CONCURRENTLY de
+            # CrashDashboard/queries_sql.MD fora do deploy (um CREATE INDEX
+            # comum trava os INSERTs da telemetria e estoura o statement_timeout)
             db.create_all()
             logger.info("✅ Tabelas do banco verificadas/criadas")
         except Exception as e:
             logger.error(f"❌ Erro ao criar tabelas: {e}")
             raise
 
+        # O SUM de log_bot pode estourar o statement_timeout num banco grande:
+        # não derruba o boot, o primeiro flush ou leitura semeia o contador
+        try:
+            _semear_lucro_total()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning("⚠️ Contador lucro_total não semeado no boot: %s", e)
+
+        logger.info(f"🔌 Pool do banco: {db.engine.pool.status()}")
         logger.info("🚀 CrashBot Store API V2 inicializada com sucesso!")
         logger.info(f"📍 Base URL: {Config.BASE_URL}")
         logger.info(f"📧 Email disponível: {EMAIL_DISPONIVEL}")
@@ -1,8 +1,11 @@
 import os
 import smtplib
 import ssl
+import threading
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from html import escape
+from string import Template
 
 # --- CONFIGURAÇÕES DO CARTEIRO ---
 SMTP_SERVER = "smtp.gmail.com"
@@ -12,6 +15,50 @@ EMAIL_REMETENTE = "contato.tucunare.bot@gmail.com"
 SENHA_APP = os.environ.get("EMAIL_SENHA_APP", "ucgz cewf sspu jpwn")
 
 
+# Conexão SMTP reaproveitada entre envios: o handshake TCP + STARTTLS + login
+# no Gmail custa mais que o envio em si. O lock serializa o uso da conexão
+# (smtplib não é thread-safe) entre as threads que mandam email
+_conexao_smtp = None
+_conexao_smtp_lock = threading.Lock()
+
+
+def _conectar_smtp():
+    """Abre e autentica uma conexão nova com o Gmail."""
+    contexto = ssl.create_default_context()
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+    server.starttls(context=contexto)  # Criptografa a conexão
+    server.login(EMAIL_REMETENTE, SENHA_APP)
+    return server
+
+
+def _obter_conexao_smtp():
+    """Devolve a conexão aberta se ela ainda responde ao NOOP, senão reconecta."""
+    global _conexao_smtp
+
+    if _conexao_smtp is not None:
+        try:
+            if _conexao_smtp.noop()[0] == 250:
+                return _conexao_smtp
+        except (smtplib.SMTPException, OSError):
+            pass
+        _fechar_conexao_smtp()
+
+    _conexao_smtp = _conectar_smtp()
+    return _conexao_smtp
+
+
+def _fechar_conexao_smtp():
+    """Descarta a conexão atual (ignora erro de quem já caiu)."""
+    global _conexao_smtp
+
+    if _conexao_smtp is not None:
+        try:
+            _conexao_smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        _conexao_smtp = None
+
+
 def _enviar_smtp_gmail(destinatario, assunto, corpo_html):
     """
     Função auxiliar (PRIVADA) que faz a conexão técnica com o Gmail.
@@ -25,14 +72,14 @@ def _enviar_smtp_gmail(destinatario, assunto, corpo_html):
         mensagem["Subject"] = assunto
         mensagem.attach(MIMEText(corpo_html, "html"))
 
-        # 2. Cria contexto de segurança (Uso do import 'ssl')
-        contexto = ssl.create_default_context()
-
-        # 3. Conecta e Envia (Uso do import 'smtplib')
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls(context=contexto)  # Criptografa a conexão
-            server.login(EMAIL_REMETENTE, SENHA_APP)
-            server.send_message(mensagem)
+        # 2. Envia pela conexão persistente; se o Gmail derrubou entre o NOOP
+        # e o envio, reconecta uma vez e tenta de novo
+        with _conexao_smtp_lock:
+            try:
+                _obter_conexao_smtp().send_message(mensagem)
+            except smtplib.SMTPServerDisconnected:
+                _fechar_conexao_smtp()
+                _obter_conexao_smtp().send_message(mensagem)
 
         print(f"✅ E-mail enviado com sucesso para: {destinatario}")
         return True
@@ -42,32 +89,23 @@ def _enviar_smtp_gmail(destinatario, assunto, corpo_html):
         return False
 
 
-def enviar_email_licenca(email_cliente, nome_cliente, chave_licenca, link_download):
+# Corpo do email em HTML, montado uma vez no import (só os campos variam)
+_CORPO_EMAIL_LICENCA = Template(
     """
-    Envia um e-mail HTML com a chave e link.
-    Agora aceita 4 parâmetros obrigatórios.
-    """
-    assunto = "🚀 Acesso Liberado: Seu Bot Chegou!"
-
-    # REMOVEMOS A LINHA QUE TINHA O LINK FIXO AQUI
-    # Agora o link_download vem direto dos parenteses da função (argumento)
-
-    # O Corpo do email em HTML
-    corpo_html = f"""
     <html>
     <body style="font-family: Arial, sans-serif; color: #333;">
         <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; border-radius: 10px;">
-            <h2 style="color: #2E86C1;">Olá, {nome_cliente}!</h2>
+            <h2 style="color: #2E86C1;">Olá, $nome_cliente!</h2>
             <p>Seu pagamento foi confirmado com sucesso. Bem-vindo ao time!</p>
 
             <div style="background-color: #f8f9fa; padding: 20px; border-radius: 5px; border-left: 5px solid #28a745; margin: 20px 0;">
                 <p style="margin: 0; font-size: 14px; color: #666;">Sua Chave de Acesso Única:</p>
-                <h1 style="margin: 10px 0; font-family: monospace; color: #000; letter-spacing: 2px;">{chave_licenca}</h1>
+                <h1 style="margin: 10px 0; font-family: monospace; color: #000; letter-spacing: 2px;">$chave_licenca</h1>
             </div>
 
             <h3>📥 Como Instalar:</h3>
             <ol style="line-height: 1.6;">
-                <li><a href="{link_download}" style="color: #2E86C1; font-weight: bold;">Clique aqui para baixar o Robô</a></li>
+                <li><a href="$link_download" style="color: #2E86C1; font-weight: bold;">Clique aqui para baixar o Robô</a></li>
                 <li>Extraia a pasta no seu computador.</li>
                 <li>Abra o arquivo <b>license_key.txt</b>.</li>
                 <li>Cole a chave acima dentro dele e salve.</li>
@@ -80,6 +118,25 @@ def enviar_email_licenca(email_cliente, nome_cliente, chave_licenca, link_downlo
     </body>
     </html>
     """
+)
+
+
+def enviar_email_licenca(email_cliente, nome_cliente, chave_licenca, link_download):
+    """
+    Envia um e-mail HTML com a chave e link.
+    Agora aceita 4 parâmetros obrigatórios.
+    """
+    assunto = "🚀 Acesso Liberado: Seu Bot Chegou!"
+
+    # REMOVEMOS A LINHA QUE TINHA O LINK FIXO AQUI
+    # Agora o link_download vem direto dos parenteses da função (argumento)
+
+    # Nome vem do pagador no Mercado Pago: escapado para não quebrar o HTML
+    corpo_html = _CORPO_EMAIL_LICENCA.substitute(
+        nome_cliente=escape(str(nome_cliente)),
+        chave_licenca=chave_licenca,
+        link_download=link_download,
+    )
 
     # Chama a função técnica de envio (certifique-se de que a função _enviar_smtp_gmail existe acima desta)
     return _enviar_smtp_gmail(email_cliente, assunto, corpo_html)
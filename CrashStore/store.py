@@ -14,12 +14,15 @@ Melhorias da V2:
 """
 
 import os
+import random
 import re
 import time
 from typing import Optional, Tuple
 
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # =============================================================================
 # CONFIGURAÇÕES
@@ -35,7 +38,8 @@ class StoreConfig:
     )
     API_TIMEOUT = int(os.environ.get("API_TIMEOUT", "30"))
     API_MAX_RETRIES = int(os.environ.get("API_MAX_RETRIES", "3"))
-    API_RETRY_DELAY = int(os.environ.get("API_RETRY_DELAY", "5"))
+    # Base do backoff exponencial entre tentativas (1s, 2s, 4s... + jitter)
+    API_RETRY_DELAY = float(os.environ.get("API_RETRY_DELAY", "1"))
 
     # Contato
     WHATSAPP_SUPORTE = os.environ.get("WHATSAPP_SUPORTE", "5565992950893")
@@ -106,6 +110,14 @@ st.set_page_config(
 # FUNÇÕES AUXILIARES
 # =============================================================================
 
+# Regex básico para email (compilado uma vez)
+_EMAIL_RE = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+
+
+def _apenas_digitos(texto: str) -> str:
+    """Mantém só os dígitos (mesmo critério do \\d do regex, filtrado em C)."""
+    return "".join(filter(str.isdecimal, texto))
+
 
 def validar_email(email: str) -> Tuple[bool, str]:
     """
@@ -117,10 +129,8 @@ def validar_email(email: str) -> Tuple[bool, str]:
     if not email:
         return False, "Email é obrigatório"
 
-    # Regex básico para email
-    padrao = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-
-    if not re.match(padrao, email):
+    # Rejeições baratas antes do regex (sem "@" ou acima do limite da RFC)
+    if "@" not in email or len(email) > 254 or not _EMAIL_RE.match(email):
         return False, "Email inválido. Use o formato: exemplo@email.com"
 
     return True, ""
@@ -136,8 +146,12 @@ def validar_whatsapp(whatsapp: str) -> Tuple[bool, str]:
     if not whatsapp:
         return False, "WhatsApp é obrigatório"
 
+    # Menos de 10 caracteres não pode ter 10 dígitos: nem passa pelo regex
+    if len(whatsapp) < 10:
+        return False, "WhatsApp inválido. Use (DD) 9XXXX-XXXX"
+
     # Remove caracteres não numéricos
-    apenas_numeros = re.sub(r"\D", "", whatsapp)
+    apenas_numeros = _apenas_digitos(whatsapp)
 
     # Valida quantidade de dígitos (10 ou 11 para Brasil)
     if len(apenas_numeros) < 10 or len(apenas_numeros) > 11:
@@ -182,7 +196,31 @@ def formatar_whatsapp(whatsapp: str) -> str:
     Returns:
         str: Número formatado (apenas dígitos)
     """
-    return re.sub(r"\D", "", whatsapp)
+    return _apenas_digitos(whatsapp)
+
+
+@st.cache_resource
+def obter_sessao_http() -> requests.Session:
+    """
+    Sessão HTTP com pool de conexões keep-alive para a API.
+
+    Fica no cache_resource porque o Streamlit reexecuta o script a cada
+    interação: um Session global seria recriado (e o TLS renegociado) sempre.
+    As retentativas ficam por conta de criar_pagamento_com_retry.
+    """
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(
+        pool_connections=4, pool_maxsize=10, max_retries=Retry(total=0)
+    )
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    return sessao
+
+
+def _espera_retry(tentativa: int) -> float:
+    """Backoff exponencial com jitter: não espera 5s fixos se a API já subiu."""
+    base = StoreConfig.API_RETRY_DELAY * (2 ** (tentativa - 1))
+    return base + random.uniform(0, base / 2)
 
 
 def criar_pagamento_com_retry(payload: dict) -> Tuple[bool, dict]:
@@ -197,7 +235,8 @@ def criar_pagamento_com_retry(payload: dict) -> Tuple[bool, dict]:
     """
     for tentativa in range(1, StoreConfig.API_MAX_RETRIES + 1):
         try:
-            response = requests.post(
+            # Mesma sessão entre tentativas: reaproveita o socket já aberto
+            response = obter_sessao_http().post(
                 StoreConfig.API_URL, json=payload, timeout=StoreConfig.API_TIMEOUT
             )
 
@@ -215,7 +254,7 @@ def criar_pagamento_com_retry(payload: dict) -> Tuple[bool, dict]:
             elif response.status_code == 500:
                 # Erro no servidor (pode retentar)
                 if tentativa < StoreConfig.API_MAX_RETRIES:
-                    time.sleep(StoreConfig.API_RETRY_DELAY)
+                    time.sleep(_espera_retry(tentativa))
                     continue
 
                 return False, {
@@ -235,7 +274,7 @@ def criar_pagamento_com_retry(payload: dict) -> Tuple[bool, dict]:
                 st.info(
                     f"⏳ Aguardando servidor... (Tentativa {tentativa}/{StoreConfig.API_MAX_RETRIES})"
                 )
-                time.sleep(StoreConfig.API_RETRY_DELAY)
+                time.sleep(_espera_retry(tentativa))
                 continue
 
             return False, {
@@ -259,6 +298,17 @@ def criar_pagamento_com_retry(payload: dict) -> Tuple[bool, dict]:
     }
 
 
+def rotulo_plano(plano: dict) -> str:
+    """Texto do plano no radio do checkout."""
+    return f"{plano['nome']} ({plano['dias']} Dias) - R$ {plano['preco']:.2f}"
+
+
+# Rótulo do radio -> código do plano (montado uma vez, busca O(1))
+ROTULO_PARA_PLANO = {
+    rotulo_plano(plano): key for key, plano in StoreConfig.PLANOS.items()
+}
+
+
 def obter_plano_selecionado(opcao: str) -> str:
     """
     Mapeia opção visual do radio para código do plano.
@@ -269,18 +319,65 @@ def obter_plano_selecionado(opcao: str) -> str:
     Returns:
         str: Código do plano (experimental, semanal, mensal)
     """
-    mapeamento = {0: "experimental", 1: "semanal", 2: "mensal"}
+    # Fallback: mensal
+    return ROTULO_PARA_PLANO.get(opcao, "mensal")
+
+
+@st.cache_data
+def montar_card_plano_html(key: str) -> str:
+    """
+    HTML do card de preço de um plano.
 
-    # Tenta encontrar índice pela string
-    opcoes = list(StoreConfig.PLANOS.keys())
+    Só depende de StoreConfig.PLANOS: fica em cache entre os reruns do
+    Streamlit em vez de ser remontado a cada clique.
+    """
+    plano = StoreConfig.PLANOS[key]
 
-    for idx, key in enumerate(opcoes):
-        plano = StoreConfig.PLANOS[key]
-        if plano["nome"] in opcao:
-            return key
+    # Badge "Mais Popular" se featured
+    badge = (
+        '<span class="badge-popular">MAIS POPULAR</span><br>'
+        if plano.get("featured")
+        else ""
+    )
 
-    # Fallback
-    return "mensal"
+    # Classe CSS
+    card_class = "price-card featured" if plano.get("featured") else "price-card"
+
+    # Features list
+    features_html = "".join([f"<li>{f}</li>" for f in plano["features"]])
+
+    # Card HTML
+    return f"""
+        <div class="{card_class}">
+            {badge}
+            <h3>{plano["nome"]}</h3>
+            <p style="color:#888">{plano["descricao"]}</p>
+            <p class="old-price">De R$ {plano["preco_antigo"]:.2f}</p>
+            <p class="price-value">R$ {plano["preco"]:.2f}</p>
+            <p>Acesso por <b>{plano["dias"]} Dias</b></p>
+            <div class="feature-list">
+                {features_html}
+            </div>
+        </div>
+        """
+
+
+@st.cache_data
+def montar_grade_planos_html() -> str:
+    """
+    Todos os cards de preço numa única grade HTML.
+
+    Um só st.markdown por rerun (uma mensagem no websocket) em vez de um
+    por plano dentro de st.columns.
+    """
+    # Cada card vira uma linha só: no markdown, uma linha em branco (o badge
+    # vazio) encerra o bloco HTML e o resto seria exibido como código
+    cards = "".join(
+        linha.strip()
+        for key in StoreConfig.PLANOS
+        for linha in montar_card_plano_html(key).splitlines()
+    )
+    return f'<div class="planos-grid">{cards}</div>'
 
 
 # =============================================================================
@@ -342,6 +439,12 @@ st.markdown(
     }
 
     /* Cards de Preço */
+    .planos-grid {
+        display: grid;
+        grid-template-columns: repeat(auto-fit, minmax(220px, 1fr));
+        gap: 1rem;
+        padding: 10px 0;
+    }
     .price-card {
         background: #111;
         border: 1px solid #333;
@@ -514,44 +617,8 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# Criar colunas para os planos
-planos_keys = list(StoreConfig.PLANOS.keys())
-cols = st.columns(len(planos_keys))
-
-for idx, (col, key) in enumerate(zip(cols, planos_keys)):
-    plano = StoreConfig.PLANOS[key]
-
-    with col:
-        # Badge "Mais Popular" se featured
-        badge = (
-            '<span class="badge-popular">MAIS POPULAR</span><br>'
-            if plano.get("featured")
-            else ""
-        )
-
-        # Classe CSS
-        card_class = "price-card featured" if plano.get("featured") else "price-card"
-
-        # Features list
-        features_html = "".join([f"<li>{f}</li>" for f in plano["features"]])
-
-        # Card HTML
-        st.markdown(
-            f"""
-        <div class="{card_class}">
-            {badge}
-            <h3>{plano["nome"]}</h3>
-            <p style="color:#888">{plano["descricao"]}</p>
-            <p class="old-price">De R$ {plano["preco_antigo"]:.2f}</p>
-            <p class="price-value">R$ {plano["preco"]:.2f}</p>
-            <p>Acesso por <b>{plano["dias"]} Dias</b></p>
-            <div class="feature-list">
-                {features_html}
-            </div>
-        </div>
-        """,
-            unsafe_allow_html=True,
-        )
+# Grade com os planos (um único markdown)
+st.markdown(montar_grade_planos_html(), unsafe_allow_html=True)
 
 st.markdown("---")
 
@@ -610,11 +677,8 @@ with center:
         # Seleção de Plano
         st.markdown("#### Selecione o Plano:")
 
-        opcoes_plano = []
-        for key in planos_keys:
-            plano = StoreConfig.PLANOS[key]
-            opcao = f"{plano['nome']} ({plano['dias']} Dias) - R$ {plano['preco']:.2f}"
-            opcoes_plano.append(opcao)
+        # Mesmos rótulos do mapa usado em obter_plano_selecionado
+        opcoes_plano = list(ROTULO_PARA_PLANO)
 
         plano_selecionado = st.radio(
             "Plano:",
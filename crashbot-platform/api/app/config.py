@@ -37,6 +37,12 @@ class Settings(BaseSettings):
         "postgresql://crash_db_user:BQudpCSoH52uCJ1Nn7qDT9bHyxeUllSU@"
         "dpg-d4i9h3re5dus73egah5g-a.oregon-postgres.render.com/crash_db"
     )
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_RECYCLE: int = 300  # Segundos; abaixo do timeout de ociosidade
+    # True quando DATABASE_URL aponta para um PgBouncer em modo transação
+    # (hostname "-pooler" no Render): desliga o cache de prepared statements
+    DB_USA_POOLER: bool = False
 
     # ========================================================================
     # REDIS (opcional - para cache e sessions)
@@ -19,14 +19,21 @@ ASYNC_DATABASE_URL = settings.DATABASE_URL.replace(
     "postgresql://", "postgresql+asyncpg://"
 )
 
+# PgBouncer em modo transação troca a conexão do servidor a cada transação:
+# prepared statements do asyncpg não sobrevivem, então o cache é desligado
+_USA_POOLER = settings.DB_USA_POOLER or "-pooler" in settings.DATABASE_URL
+_CONNECT_ARGS = {"statement_cache_size": 0} if _USA_POOLER else {}
+
 # Engine assíncrona
 engine = create_async_engine(
     ASYNC_DATABASE_URL,
     echo=settings.DEBUG,  # Log de queries em desenvolvimento
     future=True,
     pool_pre_ping=True,  # Verifica conexão antes de usar
-    pool_size=10,  # Número de conexões no pool
-    max_overflow=20,  # Conexões extras se necessário
+    pool_size=settings.DB_POOL_SIZE,  # Número de conexões no pool
+    max_overflow=settings.DB_MAX_OVERFLOW,  # Conexões extras se necessário
+    pool_recycle=settings.DB_POOL_RECYCLE,  # Renova antes do servidor derrubar
+    connect_args=_CONNECT_ARGS,
 )
 
 # Session factory
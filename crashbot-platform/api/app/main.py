@@ -13,7 +13,7 @@ from app.routers.versao import router as versao_router
 from app.routers.websocket import router as websocket_router
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, RedirectResponse
 
 # ============================================================================
 # CONFIGURAÇÃO DA APP
@@ -25,6 +25,8 @@ app = FastAPI(
     version="2.0.0",
     docs_url="/api/docs",
     redoc_url="/api/redoc",
+    # orjson (C) serializa as respostas; bots chamam validação/telemetria direto
+    default_response_class=ORJSONResponse,
 )
 
 # ============================================================================
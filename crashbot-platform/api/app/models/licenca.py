@@ -42,7 +42,8 @@ class Licenca(Base):
 
     # Informações do plano
     plano_tipo = Column(String(50), nullable=True)  # experimental, semanal, mensal
-    payment_id = Column(String(100), nullable=True)
+    # UNIQUE: base da idempotência do webhook (INSERT ... ON CONFLICT)
+    payment_id = Column(String(100), unique=True, nullable=True)
 
     def __repr__(self):
         """Representação string do objeto."""
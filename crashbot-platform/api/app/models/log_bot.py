@@ -7,7 +7,7 @@ from datetime import datetime
 from typing import cast
 
 from app.database import Base
-from sqlalchemy import Column, DateTime, Float, Integer, String, Text
+from sqlalchemy import Column, DateTime, Float, Index, Integer, String, Text
 from sqlalchemy.sql import func
 
 
@@ -37,6 +37,9 @@ class LogBot(Base):
     dados = Column(Text, nullable=True)
     lucro = Column(Float, default=0.0, nullable=False)
 
+    # Auditoria por cliente no dashboard: WHERE hwid = ... AND timestamp >= ...
+    __table_args__ = (Index("idx_log_bot_hwid_ts", hwid, timestamp.desc()),)
+
     def __repr__(self):
         """Representação string do objeto."""
         return f"<LogBot(tipo='{self.tipo}', lucro={self.lucro})>"
@@ -3,7 +3,7 @@ Router: Licenças
 Endpoints para validação de licenças e telemetria do bot.
 """
 
-import random
+import secrets
 from datetime import datetime, timedelta, timezone
 from typing import Optional, cast
 
@@ -16,13 +16,21 @@ from app.schemas.licenca import (
     ValidarLicencaRequest,
     ValidarLicencaResponse,
 )
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter(prefix="/api/v1", tags=["licencas"])
 
+# Chaves de licença: alfabeto sem O, 0, I, 1, L e RNG criptográfico
+# (random.choices usa o Mersenne Twister, previsível)
+_CARACTERES_CHAVE = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
+_RNG_CHAVES = secrets.SystemRandom()
+
+# Máximo de logs por página em /telemetria/logs (use o cursor para o resto)
+LOGS_LIMITE_MAXIMO = 500
+
 
 # ============================================================================
 # ENDPOINT: VALIDAR LICENÇA
@@ -104,24 +112,24 @@ async def receber_telemetria(
     """
     Recebe telemetria do bot.
     """
-    # Criar novo log
-    novo_log = LogBot(
-        sessao_id=payload.sessao_id,
-        hwid=payload.hwid,
-        tipo=payload.tipo,
-        dados=payload.dados,
-        lucro=payload.lucro,
-        timestamp=datetime.now(timezone.utc),
+    # INSERT ... RETURNING id via Core: uma ida ao banco, sem montar o objeto
+    # do ORM nem o SELECT extra do refresh()
+    stmt = (
+        insert(LogBot)
+        .values(
+            sessao_id=payload.sessao_id,
+            hwid=payload.hwid,
+            tipo=payload.tipo,
+            dados=payload.dados,
+            lucro=payload.lucro,
+            timestamp=datetime.now(timezone.utc),
+        )
+        .returning(LogBot.id)
     )
-
-    db.add(novo_log)
+    novo_id = (await db.execute(stmt)).scalar_one()
     await db.commit()
-    await db.refresh(novo_log)
 
-    return TelemetriaResponse(
-        status="ok",
-        id=int(novo_log.id),  # type: ignore - Cast explícito para int
-    )
+    return TelemetriaResponse(status="ok", id=novo_id)
 
 
 # ============================================================================
@@ -133,13 +141,23 @@ async def receber_telemetria(
 async def listar_licencas(
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[int] = None,
     db: AsyncSession = Depends(get_db),
     current_admin: Usuario = Depends(get_current_admin),
 ):
-    """Lista todas as licenças (endpoint admin)."""
-    result = await db.execute(
-        select(Licenca).offset(skip).limit(limit).order_by(Licenca.id.desc())
-    )
+    """
+    Lista todas as licenças (endpoint admin).
+
+    Paginação por cursor: passe em `cursor` o menor id da página anterior.
+    O banco desce direto pelo índice da PK, sem ler e descartar `skip` linhas.
+    """
+    query = select(Licenca).order_by(Licenca.id.desc()).limit(limit)
+    if cursor is not None:
+        query = query.where(Licenca.id < cursor)
+    else:
+        query = query.offset(skip)
+
+    result = await db.execute(query)
     licencas = result.scalars().all()
 
     return [licenca.to_dict() for licenca in licencas]
@@ -173,8 +191,9 @@ async def criar_licenca(
     """Cria uma nova licenca manualmente (admin)."""
     # Gerar chave unica
     # Gerar chave no formato XXXX-XXXX-XXXX-XXXX (sem caracteres ambíguos)
-    caracteres = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"  # Sem O, 0, I, 1, L
-    chave = "-".join("".join(random.choices(caracteres, k=4)) for _ in range(4))
+    # Um sorteio só de 16 caracteres, do gerador do sistema operacional
+    sorteio = "".join(_RNG_CHAVES.choices(_CARACTERES_CHAVE, k=16))
+    chave = "-".join(sorteio[i : i + 4] for i in range(0, 16, 4))
 
     # Calcular data de expiracao
     data_expiracao = datetime.now(timezone.utc) + timedelta(days=payload.dias_validade)
@@ -264,14 +283,26 @@ async def reset_hwid(
 @router.get("/telemetria/logs")
 async def listar_logs(
     skip: int = 0,
-    limit: int = 100,
+    # Teto por página: a resposta nunca carrega a tabela inteira na memória
+    limit: int = Query(100, ge=1, le=LOGS_LIMITE_MAXIMO),
+    cursor: Optional[int] = None,
     db: AsyncSession = Depends(get_db),
     current_admin: Usuario = Depends(get_current_admin),
 ):
-    """Lista todos os logs de telemetria (admin)."""
-    result = await db.execute(
-        select(LogBot).offset(skip).limit(limit).order_by(LogBot.id.desc())
-    )
+    """
+    Lista todos os logs de telemetria (admin).
+
+    Paginação por cursor: passe em `cursor` o menor id da página anterior.
+    Com log_bot crescendo sem parar, OFFSET lê e descarta `skip` linhas;
+    o cursor desce direto pelo índice da PK.
+    """
+    query = select(LogBot).order_by(LogBot.id.desc()).limit(limit)
+    if cursor is not None:
+        query = query.where(LogBot.id < cursor)
+    else:
+        query = query.offset(skip)
+
+    result = await db.execute(query)
     logs = result.scalars().all()
 
     return [
@@ -8,6 +8,7 @@ import secrets
 import string
 import uuid
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Optional  # <--- ADICIONADO
 
 import mercadopago
@@ -17,10 +18,11 @@ from app.database import get_db
 from app.models import Licenca, Usuario
 from app.services.email_service import enviar_email, template_licenca_criada
 from dotenv import load_dotenv
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
 from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
 from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 load_dotenv()
@@ -101,11 +103,17 @@ def gerar_senha_temporaria(tamanho: int = 10) -> str:
     return "".join(secrets.choice(caracteres) for _ in range(tamanho))
 
 
+@lru_cache(maxsize=1)
+def _criar_mp_sdk(access_token: str) -> mercadopago.SDK:
+    """Um SDK (e uma sessão HTTPS) por processo, reaproveitado entre requests."""
+    return mercadopago.SDK(access_token)
+
+
 def get_mp_sdk():
     """Retorna instância do SDK do Mercado Pago."""
     # Uso de walrus operator (:=) para simplificar
     if access_token := os.getenv("MP_ACCESS_TOKEN"):
-        return mercadopago.SDK(access_token)
+        return _criar_mp_sdk(access_token)
 
     raise HTTPException(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -225,6 +233,7 @@ async def criar_pagamento(
 @router.post("/webhook")
 async def webhook_mercadopago(
     request: Request,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -270,34 +279,33 @@ async def webhook_mercadopago(
         print("Metadados incompletos")
         return {"status": "error", "message": "Metadados incompletos"}
 
-    # Verificar se já existe licença para este pagamento
-    result = await db.execute(
-        select(Licenca).where(Licenca.payment_id == str(payment_id))
-    )
-    existing = result.scalar_one_or_none()
-
-    if existing:
-        print(f"Licença já existe para pagamento {payment_id}")
-        return {"status": "ok", "message": "Licença já criada"}
-
-    # Criar nova licença
+    # Criar nova licença numa única ida ao banco: o UNIQUE em payment_id
+    # torna a idempotência atômica (retries concorrentes do MP não duplicam)
     chave = gerar_chave_licenca()
     data_expiracao = datetime.now(timezone.utc) + timedelta(days=int(dias))
 
-    nova_licenca = Licenca(
-        chave=chave,
-        ativa=True,
-        data_expiracao=data_expiracao,
-        cliente_nome=nome,
-        email_cliente=email,
-        whatsapp=whatsapp,
-        plano_tipo=plano,
-        payment_id=str(payment_id),
+    stmt = (
+        pg_insert(Licenca)
+        .values(
+            chave=chave,
+            ativa=True,
+            data_expiracao=data_expiracao,
+            cliente_nome=nome,
+            email_cliente=email,
+            whatsapp=whatsapp,
+            plano_tipo=plano,
+            payment_id=str(payment_id),
+        )
+        .on_conflict_do_nothing(index_elements=["payment_id"])
+        .returning(Licenca.id)
     )
-
-    db.add(nova_licenca)
+    licenca_id = (await db.execute(stmt)).scalar_one_or_none()
     await db.commit()
 
+    if licenca_id is None:
+        print(f"Licença já existe para pagamento {payment_id}")
+        return {"status": "ok", "message": "Licença já criada"}
+
     print(f"✅ Licença criada: {chave} para {email}")
 
     # ========================================================================
@@ -343,13 +351,16 @@ async def webhook_mercadopago(
             dias=int(dias),
         )
 
-        await enviar_email(
+        # Envio roda depois da resposta: o Mercado Pago recebe o 200 sem
+        # esperar a API de email (e não reenvia o webhook por timeout)
+        background_tasks.add_task(
+            enviar_email,
             para=email,
             assunto="🎉 Sua licença CrashBot está pronta!",
             html=html_email,
         )
     except Exception as e:
-        print(f"⚠️ Erro ao enviar email: {e}")
+        print(f"⚠️ Erro ao montar email: {e}")
         # Não falha o webhook se o email falhar
 
     return {